@@ -0,0 +1,379 @@
+'''Benchmarks for the parts of EyePy that take the most time.
+Generates synthetic .del and DA1 sentence files of a chosen size, then times
+region_check(), every measure function from eye_measures, region_measures(),
+trial_measures(), read_fixation_table() and write_to_table() separately.
+The timings are saved as JSON, so that runs on different commits can be
+compared (see the --compare option).
+'''
+
+# Structure:
+# 1. Imports
+# 2. Generating synthetic data
+# 3. Timing
+# 4. Benchmarks
+# 5. Main function and command line options
+
+###############################################################################
+## Imports
+###############################################################################
+
+import os, json, time, random, platform, subprocess, tempfile
+import argparse
+import eye_measures
+from util import read_fixation_table, write_to_table
+from generate_R_table import (read_del_file, region_measures, measures_per_trial,
+    REGION_COLUMNS)
+
+
+###############################################################################
+## Generating synthetic data
+###############################################################################
+
+_WORDS = ('the', 'cat', 'sat', 'on', 'a', 'mat', 'while', 'dog', 'was',
+    'sleeping', 'quietly', 'nearby', 'and', 'nobody', 'noticed')
+
+
+def make_item_text(rnd, regions, lines):
+    '''Returns the text of a .del item with the given number of regions, which
+    are spread as evenly as possible over the given number of lines.
+    '''
+    region_texts = [' '.join(rnd.choice(_WORDS) for w in range(rnd.randint(1, 3))) + ' '
+        for r in range(regions)]
+    lines = max(1, min(lines, regions))
+    line_texts = []
+    for line in range(lines):
+        line_regions = region_texts[line * regions // lines:(line + 1) * regions // lines]
+        line_texts.append(''.join('/' + text for text in line_regions))
+    # the last region also needs a slash at its end
+    return '\\n'.join(line_texts) + '/'
+
+
+def make_del_file(file_name, rnd, conditions, items, regions, lines):
+    '''Writes a .del file with every combination of conditions and items.'''
+    with open(file_name, 'w') as del_file:
+        for cond in range(1, conditions + 1):
+            for item in range(1, items + 1):
+                text = make_item_text(rnd, regions, lines)
+                del_file.write('{0} {1} {2}\n'.format(cond, item, text))
+
+
+def make_fixations(rnd, line_lengths, fixations):
+    '''Returns a list of (X, Y, start, end) fixations that mostly move forward
+    through the lines, with some regressions and some fixations that were
+    not edited properly (X == -1).
+    '''
+    result = []
+    x, y, time_now = 0, 0, 0
+    for f in range(fixations):
+        if rnd.random() < 0.15:
+            # regression
+            x = max(0, x - rnd.randint(5, 30))
+        else:
+            x += rnd.randint(3, 12)
+            if x >= line_lengths[y] and y + 1 < len(line_lengths):
+                x, y = rnd.randint(0, 5), y + 1
+        duration = rnd.randint(50, 600)
+        X = -1 if rnd.random() < 0.01 else x
+        result.append((X, y, time_now, time_now + duration))
+        time_now += duration + rnd.randint(10, 40)
+    return result
+
+
+def make_da1_file(file_name, rnd, del_lines, fixations):
+    '''Writes a DA1 sentence file with one trial for every item in del_lines
+    (as (condition, item, line_lengths) tuples), in random order.
+    '''
+    trials = list(del_lines)
+    rnd.shuffle(trials)
+    with open(file_name, 'w') as da1_file:
+        for order, (cond, item, line_lengths) in enumerate(trials, 1):
+            trial_fixations = make_fixations(rnd, line_lengths, fixations)
+            fields = [order, cond, item, 5000, 2, 0, 0, len(trial_fixations)]
+            for fixation in trial_fixations:
+                fields.extend(fixation)
+            da1_file.write(' '.join(map(str, fields)) + '\n')
+
+
+def make_study(folder, subjects=20, conditions=4, items=40, regions=8, lines=2,
+               fixations=30, seed=1):
+    '''Writes a .del file ("study.del") and one DA1 sentence file per subject
+    into folder. Every subject sees every item in one of the conditions.
+    Returns the name of the .del file and a list of DA1 file names.
+    '''
+    rnd = random.Random(seed)
+    del_file_name = os.path.join(folder, 'study.del')
+    make_del_file(del_file_name, rnd, conditions, items, regions, lines)
+    # line lengths of every item, for placing the fixations on the lines
+    with open(del_file_name) as del_file:
+        split_lines = [line.rstrip('\n').split(' ', 2) for line in del_file]
+    item_lines = dict(((cond, item), [len(line.replace('/', ''))
+        for line in text.split('\\n')]) for cond, item, text in split_lines)
+
+    da1_file_names = []
+    for subj in range(1, subjects + 1):
+        # conditions rotate over items and subjects (a Latin square)
+        del_lines = []
+        for item in range(1, items + 1):
+            tag = (str((item + subj) % conditions + 1), str(item))
+            del_lines.append(tag + (item_lines[tag],))
+        da1_file_name = os.path.join(folder, '{0}-study-s.da1'.format(subj))
+        make_da1_file(da1_file_name, rnd, del_lines, fixations)
+        da1_file_names.append(da1_file_name)
+    return del_file_name, da1_file_names
+
+
+###############################################################################
+## Timing
+###############################################################################
+
+def time_function(function, repeat):
+    '''Calls function() "repeat" times and returns a dictionary with the best
+    and the mean wall time in seconds.
+    '''
+    times = []
+    for r in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'best': min(times), 'mean': sum(times) / len(times), 'repeat': repeat}
+
+
+def git_commit():
+    '''Returns the current commit of the repository this script is in, or None
+    if that cannot be found out.
+    '''
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+###############################################################################
+## Benchmarks
+###############################################################################
+
+# single-measure functions from eye_measures, by measure name
+_MEASURE_FUNCTIONS = (
+    ('ff', eye_measures.first_fixation),
+    ('fp', eye_measures.first_pass),
+    ('fs', eye_measures.first_skip),
+    ('sf', eye_measures.single_fixation),
+    ('pr', eye_measures.prob_regression),
+    ('rp', eye_measures.regression_path),
+    ('rb', eye_measures.right_bound),
+    ('tt', eye_measures.total_time),
+    ('rr', eye_measures.rereading_time),
+    ('prr', eye_measures.prob_rereading),
+)
+
+
+# names of all the benchmarks, in the order they are run
+BENCHMARK_NAMES = (('region_check',)
+    + tuple('measure_' + name for name, function in _MEASURE_FUNCTIONS)
+    + ('region_measures', 'trial_measures', 'read_fixation_table',
+       'write_to_table'))
+
+
+def load_trials(del_file_name, da1_file_names):
+    '''Returns a list of (trial_fields, regions, fixations) tuples for all the
+    trials of all the subjects, in the form the measure functions expect.
+    '''
+    region_data, table_of_regions, word_dict = read_del_file(del_file_name)
+    trials = []
+    for file_name in da1_file_names:
+        for tag, (trial_fields, fixations) in read_fixation_table(file_name).items():
+            trials.append((trial_fields, table_of_regions[tag], fixations))
+    return trials
+
+
+def region_check_benchmark(trials):
+    '''Calls region_check() for every fixation and region of every trial.'''
+    def run():
+        for trial_fields, regions, fixations in trials:
+            for region in regions:
+                for X, Y, duration in fixations:
+                    eye_measures.region_check(region, X, Y)
+    calls = sum(len(regions) * len(fixations)
+        for trial_fields, regions, fixations in trials)
+    return run, calls
+
+
+def measure_benchmark(measure_function, trials):
+    '''Calls one measure function for every region of every trial.'''
+    def run():
+        for trial_fields, regions, fixations in trials:
+            for region in regions:
+                measure_function(region, fixations)
+    return run, sum(len(regions) for trial_fields, regions, fixations in trials)
+
+
+def region_measures_benchmark(trials):
+    '''Computes all the measures for every region with region_measures().'''
+    def run():
+        for trial_fields, regions, fixations in trials:
+            for region in regions:
+                tuple(region_measures(region, fixations))
+    return run, sum(len(regions) for trial_fields, regions, fixations in trials)
+
+
+def trial_measures_benchmark(trials):
+    '''Computes all the measures for every trial at once with
+    eye_measures.trial_measures(), including compiling the regions.
+    '''
+    def run():
+        for trial_fields, regions, fixations in trials:
+            eye_measures.trial_measures(regions, fixations)
+    return run, len(trials)
+
+
+def read_benchmark(da1_file_names):
+    '''Reads every DA1 sentence file with read_fixation_table().'''
+    def run():
+        for file_name in da1_file_names:
+            read_fixation_table(file_name)
+    return run, len(da1_file_names)
+
+
+def write_benchmark(trials, folder):
+    '''Writes the rows of an R table (without the words) for all the trials
+    with write_to_table().
+    '''
+    rows = []
+    for trial_fields, regions, fixations in trials:
+        rows.extend(measures_per_trial('1', (trial_fields + ('NA', 'NA'),),
+            (regions,), (fixations,)))
+    header = REGION_COLUMNS + ['fixationtype', 'value']
+    file_name = os.path.join(folder, 'table.txt')
+    def run():
+        write_to_table(file_name, rows, header=header, delimiter='\t', restval=' ')
+    return run, len(rows)
+
+
+def make_benchmarks(folder, del_file_name, da1_file_names):
+    '''Returns a list of (name, (function, calls)) pairs for all benchmarks.'''
+    trials = load_trials(del_file_name, da1_file_names)
+    benchmarks = [('region_check', region_check_benchmark(trials))]
+    benchmarks += [('measure_' + name, measure_benchmark(function, trials))
+        for name, function in _MEASURE_FUNCTIONS]
+    benchmarks += [
+        ('region_measures', region_measures_benchmark(trials)),
+        ('trial_measures', trial_measures_benchmark(trials)),
+        ('read_fixation_table', read_benchmark(da1_file_names)),
+        ('write_to_table', write_benchmark(trials, folder)),
+    ]
+    return benchmarks
+
+
+def run_benchmarks(folder, arguments):
+    '''Generates the data in folder, runs the selected benchmarks and returns
+    a dictionary with the results and the settings they were run with.
+    '''
+    settings = dict((name, getattr(arguments, name)) for name in
+        ('subjects', 'conditions', 'items', 'regions', 'lines', 'fixations',
+         'seed'))
+    del_file_name, da1_file_names = make_study(folder, subjects=arguments.subjects,
+        conditions=arguments.conditions, items=arguments.items,
+        regions=arguments.regions, lines=arguments.lines,
+        fixations=arguments.fixations, seed=arguments.seed)
+
+    results = {}
+    for name, (function, calls) in make_benchmarks(folder, del_file_name, da1_file_names):
+        if arguments.only and name not in arguments.only:
+            continue
+        result = time_function(function, arguments.repeat)
+        result['calls'] = calls
+        result['best_per_call_us'] = result['best'] / calls * 1e6 if calls else None
+        results[name] = result
+        print('{0:<22}{1:>10.4f} s {2:>12} calls'.format(name, result['best'], calls))
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'settings': settings,
+        'results': results,
+    }
+
+
+def compare_results(old, new):
+    '''Prints the best times of two runs side by side.'''
+    print('\n{0:<22}{1:>12}{2:>12}{3:>10}'.format('benchmark',
+        str(old.get('commit')), str(new.get('commit')), 'ratio'))
+    if old['settings'] != new['settings']:
+        print('Note: the runs used different settings.')
+    for name, result in new['results'].items():
+        if name not in old['results']:
+            continue
+        old_best = old['results'][name]['best']
+        print('{0:<22}{1:>12.4f}{2:>12.4f}{3:>10.2f}'.format(name, old_best,
+            result['best'], old_best / result['best'] if result['best'] else 0))
+
+
+###############################################################################
+## Main
+###############################################################################
+
+def main():
+    arguments = parse_arguments()
+    if arguments.data_dir:
+        os.makedirs(arguments.data_dir, exist_ok=True)
+        report = run_benchmarks(arguments.data_dir, arguments)
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            report = run_benchmarks(folder, arguments)
+
+    with open(arguments.output, 'w') as output:
+        json.dump(report, output, indent=1, sort_keys=True)
+    print('Saved the results to "{0}"'.format(arguments.output))
+
+    if arguments.compare:
+        with open(arguments.compare) as old_file:
+            compare_results(json.load(old_file), report)
+
+
+def parse_arguments(argv=None):
+    '''Defines and reads the command line options of this script.'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    for name, default, help_text in (
+            ('subjects', 20, 'number of subjects'),
+            ('conditions', 4, 'number of conditions'),
+            ('items', 40, 'number of items (every subject sees all of them)'),
+            ('regions', 8, 'regions per item'),
+            ('lines', 2, 'lines per item'),
+            ('fixations', 30, 'fixations per trial'),
+            ('seed', 1, 'seed for the random data'),
+            ('repeat', 3, 'run every benchmark this many times and keep the best')):
+        parser.add_argument('--' + name,
+            type=int,
+            default=default,
+            metavar='N',
+            help='{0} (default: {1})'.format(help_text, default))
+    parser.add_argument('--only',
+        nargs='+',
+        choices=BENCHMARK_NAMES,
+        metavar='NAME',
+        help='only run these benchmarks (e.g. region_check measure_fp)')
+    parser.add_argument('--output',
+        default='benchmark.json',
+        metavar='FILE',
+        help='where to save the results (default: benchmark.json)')
+    parser.add_argument('--compare',
+        metavar='FILE',
+        help='compare the results with an earlier run saved in FILE')
+    parser.add_argument('--data-dir',
+        metavar='DIR',
+        help='write the synthetic files to DIR and keep them, instead of '
+            'using a temporary folder')
+    arguments = parser.parse_args(argv)
+    for name in ('subjects', 'conditions', 'items', 'regions', 'lines', 'repeat'):
+        if getattr(arguments, name) < 1:
+            parser.error('--{0} has to be at least 1'.format(name))
+    if arguments.fixations < 0:
+        parser.error('--fixations cannot be negative')
+    return arguments
+
+
+if __name__ == '__main__':
+    main()
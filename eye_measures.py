@@ -9,6 +9,9 @@
 # rewrote the measure functions and moved cutoff filtering to another script
 # added two new measures: single fixation and probability of rereading
 
+# binary search for looking up fixations in compiled region layouts
+from bisect import bisect_right
+
 
 def region_check(region, fixationX, fixationY):
     '''Takes a region in the form [[Xstart, Ystart],[Xend, Yend]] and a pair of
@@ -151,15 +154,18 @@ def regression_path(region, fixations):
     return regression_sum
 
 
-def prob_regression(region, fixations):
+def prob_regression(region, fixations, skipped=None):
     '''Returns either 1 or 0 depending on whether a regression happens
     from current region.
+    "skipped" is the first_skip() value of the region, if it is already known.
     '''
     was_visited = False
     regression_prob = 0
 
+    if skipped is None:
+        skipped = first_skip(region, fixations)
     # set this value to "NA" if there was no first fixation on the region
-    if first_skip(region, fixations):
+    if skipped:
         return 'NA'
 
     ## loop through each fixation
@@ -199,12 +205,16 @@ def right_bound(region, fixations):
     return right_bound_sum
 
 
-def rereading_time(region, fixations):
+def rereading_time(region, fixations, total=None, first_duration=None):
     '''Returns the difference between total reading time and the first pass
     reading time for the current region.
+    Either of them is only computed here if it is not given.
     '''
-    first_duration = first_pass(region, fixations)
-    return total_time(region, fixations,) - first_duration
+    if first_duration is None:
+        first_duration = first_pass(region, fixations)
+    if total is None:
+        total = total_time(region, fixations)
+    return total - first_duration
 
 
 def total_time(region, fixations):
@@ -221,22 +231,397 @@ def total_time(region, fixations):
     return total_time_sum
 
 
-def single_fixation(region, fixations):
+def single_fixation(region, fixations, first_fix=None, total_fixation=None):
     '''Given a region, fixation list, and low/high cutoff values, returns
     the duration of the fixation on the region if it was the only fixation.
     Otherwise returns zero.
+    The first fixation and total time are only computed here if they are
+    not given.
     '''
-    first_fix = first_fixation(region, fixations)
-    total_fixation = total_time(region, fixations)
+    if first_fix is None:
+        first_fix = first_fixation(region, fixations)
+    if total_fixation is None:
+        total_fixation = total_time(region, fixations)
     if first_fix == total_fixation:
         return total_fixation
     else:
         return 0
 
 
-def prob_rereading(region, fixations):
+def prob_rereading(region, fixations, reread=None):
     '''given a region and a fixations list calculates whether the region was
     reread or not.
     Returns either 1 or 0, having converted boolean test to an integer.
+    "reread" is the rereading_time() of the region, if it is already known.
+    '''
+    if reread is None:
+        reread = rereading_time(region, fixations)
+    return int(reread > 0)
+
+
+###############################################################################
+## Registry of measures
+###############################################################################
+
+class Measure(object):
+    '''A measure in the registry (see register_measure()): its name in the
+    R table, the function that computes it, the names of the measures that
+    function needs, and whether the measure is binomial (1 or 0, and thus
+    never set to "NA").
+    '''
+    __slots__ = ('name', 'function', 'dependencies', 'binomial')
+
+    def __init__(self, name, function, dependencies, binomial):
+        self.name = name
+        self.function = function
+        self.dependencies = dependencies
+        self.binomial = binomial
+
+
+# all measures that can be computed, by name, in the order they were registered
+MEASURES = {}
+
+
+def register_measure(name, function, dependencies=(), binomial=False):
+    '''Adds a measure to the registry, so that it can be selected with the
+    --measures option of generate_R_table.py. The function is called as
+    function(region, fixations, *values), where values are those of the
+    measures named in "dependencies" for the same region. Dependencies have
+    to be registered first, which also rules out circular dependencies.
+    '''
+    if name in MEASURES:
+        raise ValueError('measure "{0}" is already registered'.format(name))
+    unknown = [dependency for dependency in dependencies
+        if dependency not in MEASURES]
+    if unknown:
+        raise ValueError('measure "{0}" depends on unknown measures: {1}'.format(
+            name, ', '.join(unknown)))
+    MEASURES[name] = Measure(name, function, tuple(dependencies), binomial)
+
+
+def binomial_measures(names):
+    '''Returns the names of the binomial measures among "names".'''
+    return tuple(name for name in names if MEASURES[name].binomial)
+
+
+def compute_measures(region, fixations, names, known=None):
+    '''Returns a tuple with the values of the measures "names" for a region.
+    Every measure (including those the requested ones depend on) is computed
+    at most once. "known" is a dictionary of values that have already been
+    computed for the region (e.g. by trial_measures()); they are used as
+    they are.
+    '''
+    values = dict(known) if known else {}
+    return tuple(_measure_value(name, region, fixations, values)
+        for name in names)
+
+
+def _measure_value(name, region, fixations, values):
+    '''Returns the value of one measure for compute_measures(), computing it
+    and its dependencies unless they are already in "values".
+    '''
+    if name not in values:
+        measure = MEASURES[name]
+        arguments = [_measure_value(dependency, region, fixations, values)
+            for dependency in measure.dependencies]
+        values[name] = measure.function(region, fixations, *arguments)
+    return values[name]
+
+
+# the built-in measures, with the intermediate results they share
+register_measure('ff', first_fixation)
+register_measure('fp', first_pass)
+register_measure('fs', first_skip, binomial=True)
+register_measure('rp', regression_path)
+register_measure('rb', right_bound)
+register_measure('tt', total_time)
+register_measure('sf', single_fixation, ('ff', 'tt'))
+register_measure('pr', prob_regression, ('fs',), binomial=True)
+register_measure('rr', rereading_time, ('tt', 'fp'))
+register_measure('prr', prob_rereading, ('rr',), binomial=True)
+
+
+###############################################################################
+## Classifying fixations relative to all regions of an item at once
+###############################################################################
+
+class RegionLayout(tuple):
+    '''The regions of one (condition, item), compiled for fast lookups.
+    A RegionLayout is a tuple of regions exactly like the values returned by
+    util.read_region_table(), so it can be used wherever such a tuple is used.
+    In addition, it can map a fixation to its position relative to ALL the
+    regions with one binary search over the (line, x) starts of the regions,
+    instead of calling region_check() once per region.
+
+    The result of that search is a "region index" for the fixation:
+    2 * r + 1 if the fixation is within region r, 2 * r if it is after region
+    r - 1 but before region r, and -1 if it should be ignored (X == -1).
+    indexed_measures() computes the measures from these indices.
+
+    This only works if the regions follow each other in reading order, which
+    is always the case for regions made from a .del file. For other layouts
+    (e.g. hand-edited .reg files) we fall back to region_check().
+    '''
+
+    def __new__(cls, regions):
+        layout = tuple.__new__(cls, regions)
+        # (line, x) tuples sort in reading order
+        layout.starts = [(yStart, xStart)
+            for (xStart, yStart), (xEnd, yEnd) in layout]
+        layout.ends = [(yEnd, xEnd)
+            for (xStart, yStart), (xEnd, yEnd) in layout]
+        # regions spanning several lines, with the two lines they are on
+        layout.multiline = dict((r, (yStart, yEnd))
+            for r, ((xStart, yStart), (xEnd, yEnd)) in enumerate(layout)
+            if yStart != yEnd)
+        layout.regular = is_reading_order(layout.starts, layout.ends)
+        return layout
+
+    def region_index(self, X, Y):
+        '''Returns the region index (see above) of a fixation.'''
+        if X == -1:
+            return -1
+        point = (Y, X)
+        # number of regions that start at or before the fixation
+        k = bisect_right(self.starts, point)
+        if k and point < self.ends[k - 1]:
+            return 2 * k - 1
+        return 2 * k
+
+
+def is_reading_order(starts, ends):
+    '''Checks that every region starts no later than it ends, ends no later
+    than the next region starts, and does not run backwards across lines.
+    '''
+    for start, end in zip(starts, ends):
+        if start > end:
+            return False
+    for end, next_start in zip(ends, starts[1:]):
+        if end > next_start:
+            return False
+    return True
+
+
+def compile_region_table(table_of_regions):
+    '''Given a table of regions as returned by util.read_region_table(),
+    returns the same table with every sequence of regions compiled into a
+    RegionLayout.
+    '''
+    return dict((tag, RegionLayout(regions))
+        for tag, regions in table_of_regions.items())
+
+
+###############################################################################
+## Computing all measures for a trial in one pass
+###############################################################################
+
+# Names of the measures computed by trial_measures(), in the order in which
+# they appear in the output table. Measures registered in addition to these
+# are computed from their values, see compute_measures().
+MEASURE_NAMES = ('ff', 'fp', 'fs', 'sf', 'pr', 'rp', 'rb', 'tt', 'rr', 'prr')
+
+# Measures that are either 1 or 0 and thus should never be set to "NA",
+# as marked in the registry.
+BINOMIAL_MEASURES = binomial_measures(MEASURE_NAMES)
+
+
+def trial_measures(regions, fixations):
+    '''Given all the regions of a trial and the fixations for that trial,
+    calculates every measure in MEASURE_NAMES for every region.
+    Unlike calling the measure functions above one by one, the fixations are
+    looped over only once and every fixation is compared to every region only
+    once. The values are exactly the same as those returned by the
+    single-measure functions.
+    Returns a list with one tuple of measure values per region.
+    '''
+    # compile the regions unless that has already been done for the whole
+    # table of regions (see compile_region_table())
+    if not isinstance(regions, RegionLayout):
+        regions = RegionLayout(regions)
+    if regions.regular:
+        return indexed_measures(regions, fixations)
+    # for every fixation, its positions relative to all the regions
+    positions = [tuple(region_check(region, X, Y) for region in regions)
+        for X, Y, duration in fixations]
+    return fused_measures(len(regions), fixations, positions)
+
+
+def indexed_measures(layout, fixations):
+    '''Computes the same values as fused_measures() for a RegionLayout in
+    reading order, from the region index of every fixation (see
+    RegionLayout.region_index()). Instead of comparing every fixation to
+    every region, a fixation only updates the regions it can change:
+    - the region it is within
+    - the regions it is after for the first time; after that, a fixation
+      after a region only adds to its total time if it is within it again
+    - the "open" regions, which were entered and not yet exited to the
+      right; fixations before or outside any other region change nothing
+    Regions spanning several lines only see fixations on their first and
+    last line (like region_check()), so such a region can be passed without
+    being exited. It is then "lagging" until a fixation on its last line
+    after its end exits it.
+    '''
+    region_count = len(layout)
+    multiline = layout.multiline
+    region_index = layout.region_index
+    # per-region running values, as in fused_measures()
+    first_fix = [0] * region_count
+    skipped = [1] * region_count
+    first_pass_sum = [0] * region_count
+    regression_sum = [0.0] * region_count
+    right_bound_sum = [0.0] * region_count
+    regressed = [0] * region_count
+    total = [0] * region_count
+    # per-region flags for the measures that stop early
+    first_done = [False] * region_count
+    pass_done = [False] * region_count
+    right_done = [False] * region_count
+    # entered and not exited to the right
+    open_regions = set()
+    # passed multi-line regions that have not been exited yet
+    lagging = []
+    # number of regions that some fixation has been after
+    passed = 0
+
+    for X, Y, duration in fixations:
+        k = region_index(X, Y)
+        if k == -1:
+            # ignored fixations only add to regression paths
+            for r in open_regions:
+                if regression_sum[r] > 0:
+                    regression_sum[r] += duration
+            continue
+        # the fixation is after the regions before index p
+        p = k >> 1
+        exited = []
+        while passed < p:
+            if passed in multiline and Y != multiline[passed][1]:
+                lagging.append(passed)
+            else:
+                exited.append(passed)
+            passed += 1
+        if lagging:
+            still_lagging = []
+            for r in lagging:
+                if r < p and Y == multiline[r][1]:
+                    exited.append(r)
+                else:
+                    still_lagging.append(r)
+            lagging = still_lagging
+        for r in exited:
+            first_done[r] = pass_done[r] = right_done[r] = True
+            open_regions.discard(r)
+
+        within = -1
+        if k & 1 and (p not in multiline or Y in multiline[p]):
+            within = p
+            total[p] += duration
+            if not first_done[p]:
+                first_fix[p] = duration
+                skipped[p] = 0
+                first_done[p] = True
+            if not pass_done[p]:
+                first_pass_sum[p] += duration
+            if not right_done[p]:
+                regression_sum[p] += duration
+                right_bound_sum[p] += duration
+                open_regions.add(p)
+
+        for r in open_regions:
+            if r == within:
+                continue
+            # the fixation is before r, unless r spans several lines and the
+            # fixation is on neither of its lines (or on a line in between)
+            if ((r > p or (r == p and not k & 1))
+                    and (r not in multiline or Y in multiline[r])):
+                if first_pass_sum[r] > 0:
+                    pass_done[r] = True
+                regressed[r] = 1
+            if regression_sum[r] > 0:
+                regression_sum[r] += duration
+
+    return collect_measures(first_fix, first_pass_sum, skipped, regressed,
+        regression_sum, right_bound_sum, total)
+
+
+def fused_measures(region_count, fixations, position_rows):
+    '''Runs the state machine behind trial_measures().
+    Expects the number of regions, the fixations of a trial and, for every
+    fixation, a sequence of positions ('before', 'within', 'after', 'ignore'
+    or None) of that fixation relative to every region.
+    Every region keeps track of the same things the single-measure functions
+    do, in particular when each of them would have stopped looping over the
+    fixations:
+    - first fixation and first skip stop at the first 'within' or 'after'
+    - first pass stops at 'after' or at 'before' once the region was entered
+    - regression path, right bound and probability of regression stop at 'after'
+    - total time never stops
+    '''
+    indices = range(region_count)
+    # per-region running values
+    first_fix = [0] * region_count
+    skipped = [1] * region_count
+    first_pass_sum = [0] * region_count
+    regression_sum = [0.0] * region_count
+    right_bound_sum = [0.0] * region_count
+    regressed = [0] * region_count
+    visited = [False] * region_count
+    total = [0] * region_count
+    # per-region flags for the measures that stop early
+    first_done = [False] * region_count
+    pass_done = [False] * region_count
+    right_done = [False] * region_count
+
+    for (X, Y, duration), row in zip(fixations, position_rows):
+        for r, position in zip(indices, row):
+            if position == 'within':
+                total[r] += duration
+                if not first_done[r]:
+                    first_fix[r] = duration
+                    skipped[r] = 0
+                    first_done[r] = True
+                if not pass_done[r]:
+                    first_pass_sum[r] += duration
+                if not right_done[r]:
+                    regression_sum[r] += duration
+                    right_bound_sum[r] += duration
+                    visited[r] = True
+            elif position == 'after':
+                first_done[r] = True
+                pass_done[r] = True
+                right_done[r] = True
+            else:
+                if position == 'before':
+                    if first_pass_sum[r] > 0:
+                        pass_done[r] = True
+                    if visited[r] and not right_done[r]:
+                        regressed[r] = 1
+                # once entered, regression path adds up everything until
+                # the region is exited to the right
+                if not right_done[r] and regression_sum[r] > 0:
+                    regression_sum[r] += duration
+
+    return collect_measures(first_fix, first_pass_sum, skipped, regressed,
+        regression_sum, right_bound_sum, total)
+
+
+def collect_measures(first_fix, first_pass_sum, skipped, regressed,
+                     regression_sum, right_bound_sum, total):
+    '''Turns the per-region running values of fused_measures() and
+    indexed_measures() into one tuple of MEASURE_NAMES values per region.
     '''
-    return int(rereading_time(region, fixations) > 0)
+    all_measures = []
+    for r in range(len(total)):
+        reread = total[r] - first_pass_sum[r]
+        if first_fix[r] == total[r]:
+            single = total[r]
+        else:
+            single = 0
+        if skipped[r]:
+            prob_regr = 'NA'
+        else:
+            prob_regr = regressed[r]
+        all_measures.append((first_fix[r], first_pass_sum[r], skipped[r],
+            single, prob_regr, regression_sum[r], right_bound_sum[r],
+            total[r], reread, int(reread > 0)))
+    return all_measures
@@ -39,12 +39,39 @@ from eye_measures import *
 
 from mergewords import *
 
+# optional NumPy implementation of the measures, see --engine below
+import vector_measures
+# command line options
+import argparse
+# for processing several subjects at the same time
+from concurrent.futures import ProcessPoolExecutor
+# for reading the files of a subject in the process that handles it
+from functools import partial
+# for only regenerating the rows of subjects whose data changed
+from incremental import subj_digests, changed_subjects, splice_table, write_manifest
+# for the --profile option
+import profiling
+import eye_measures
+
 
 ###########################################################
 ## The main function
 ###########################################################
 
 def main():
+    # read command line options; running the script without any options
+    # asks all the questions below just like before
+    arguments = parse_arguments()
+    measure_engine = get_measure_engine(arguments.engine, arguments.cross_check,
+        arguments.measures)
+    if arguments.profile is not None:
+        start_profiling()
+    # where to keep parsed DA1 files between runs
+    if arguments.no_cache:
+        cache_dir = None
+    else:
+        cache_dir = arguments.cache_dir or default_cache_dir()
+
     # define list of questions to be asked of user when they run the file
     our_questions = [
         'REG (or DEL) filename',
@@ -53,71 +80,309 @@ def main():
         'Question data folder',
         'Output filename',
     ]
+    if arguments.variants:
+        # with several variants the region files are given on the command
+        # line and output file names are made from them
+        our_questions.remove('REG (or DEL) filename')
+        our_questions.remove('Output filename')
     # ask user to provide values for these questions using function imported
     # from util module
     file_names = ask_user_questions(our_questions)
 
-    # check with user about cutoff boundaries
-    cutoffs = verify_cutoff_values(40, 1000)
+    # check with user about cutoff boundaries, unless they were given
+    # on the command line
+    if arguments.cutoffs:
+        cutoff_grid = arguments.cutoffs
+    else:
+        cutoff_grid = [verify_cutoff_values(40, 1000)]
+    cutoffs = cutoff_grid[0]
 
-    # Get a region dictionary in the following format.
-    # Key = unique cond/item tag;
-    # value = (((xStart, yStart), (xEnd, yEnd)), ...)
-    table_of_regions = get_region_table(file_names['REG (or DEL) filename'])
     # Using functions from the util module, create a dictionary of correct
     # answers to all the questions
     # Key = item number;
     # value = (correct_button_code, LeftorRight)
-    
-    # THE TWO LINES BELOW ARE COMMENTED BECAUSE THEY DON'T WORK CORRECTLY.
-    # THE LINE BELOW THEM IS A QUICK FIX (ALSO SEE LINE 396). 
-    #answer_key = dict_from_table(read_table(file_names['Question key filename']),
-    #                                               paired=False)
-    answer_key = dict_from_table(tag_table(read_table(file_names['Question key filename']), 0, 1))
-    
+    answer_key = read_answer_key(file_names['Question key filename'])
+
+    if arguments.variants or len(cutoff_grid) > 1:
+        # several R tables from one load of the subject data
+        tables_by_subj = create_subj_tables(file_names['Sentence data folder'],
+                                            file_names['Question data folder'],
+                                            compact=arguments.compact,
+                                            cache_dir=cache_dir)
+        if arguments.variants:
+            region_files = arguments.variants
+            output_files = [split_extension(regions_file)[0] + '.txt'
+                for regions_file in region_files]
+        else:
+            region_files = [file_names['REG (or DEL) filename']]
+            output_files = [file_names['Output filename']]
+        make_tables(region_files, output_files, cutoff_grid, tables_by_subj,
+            answer_key, measure_engine, cache_dir=cache_dir,
+            wide=arguments.wide, codes=arguments.codes,
+            measures=arguments.measures)
+        evict_cache(cache_dir, arguments.cache_size)
+        write_profile(arguments.profile, output_files[0])
+        return
+
+    # Get a region dictionary in the following format.
+    # Key = unique cond/item tag;
+    # value = (((xStart, yStart), (xEnd, yEnd)), ...)
+    # together with the words of every region for the R table
+    with profiling.stage('region table'):
+        table_of_regions, word_dict = load_regions(
+            file_names['REG (or DEL) filename'], cache_dir)
+        # compile the regions of every item so that fixations can be looked
+        # up with a binary search instead of being compared to every region
+        table_of_regions = compile_region_table(table_of_regions)
+
+    # the exclusion counts are compressed if the R table is
+    exclusion_file = exclusion_file_name(file_names['Output filename'])
+
     # take locations of sentence and question files (all defined by the user)
     # turn these into a sequence of tuples of the form:
-    # (subject#, list_of_fixations, list_of_questions)
-    tables_by_subj = create_subj_tables(file_names['Sentence data folder'],
-                                        file_names['Question data folder'])
-
-    # collect fixation  data for all subjects as well as exclusion stats
-    all_subj_data = tuple(process_subj(tables_by_subj, table_of_regions,
-            answer_key, cutoffs))
-    print('Done processing. Created data for {0} subjects.'.format(len(all_subj_data)))
-
-    # split subject data into fixation information and exclusion statistics
-    # If you unpack a list of tuples using "*" and then pass it to
-    # the zip() function, you end up with two sequences: one with all the
-    # first members of the tuples and one with all the second members of the tuples
-    subj_rows, subj_exclusions = tuple(zip(*all_subj_data))
-    # make fixation data compatible with csv.DictWriter (use itertools fxn for that)
-    # Convert it from a list of lists (one for every subject in turn consisting
-    # of data rows for that subject) to a flat list of rows
-    flattened_subj_rows = chain(*subj_rows)
-
-    # define output header and write to file
-    fixation_table_header = [
-        'subj',
-        'order',
-        'cond',
-        'item',
-        'questionRT',
-        'questionAcc',
-        'region',
-        'Xstart',
-        'Xend',
-        'Ystart',
-        'Yend',
-        'fixationtype',
-        'value',
-    ]
+    # (subject#, sentence_file, question_file)
+    # The files of every subject are only read once that subject is processed
+    if arguments.incremental:
+        # figure out which subjects changed since the last run
+        with profiling.stage('file discovery'):
+            all_subj_files = create_subj_files(file_names['Sentence data folder'],
+                                               file_names['Question data folder'])
+        settings = output_settings(file_names, cutoffs, arguments)
+        with profiling.stage('hashing'):
+            digests = subj_digests(all_subj_files)
+        changed = changed_subjects(file_names['Output filename'],
+            exclusion_file, settings, digests)
+        if changed is None:
+            print('Generating the whole R table.')
+            changed = set(digests)
+        else:
+            print('Only {0} of {1} subjects changed since the last run.'.format(
+                len(changed), len(digests)))
+        # only load and process the subjects that changed
+        subj_files = [subj for subj in all_subj_files if subj[0] in changed]
+    else:
+        with profiling.stage('file discovery'):
+            subj_files = create_subj_files(file_names['Sentence data folder'],
+                                           file_names['Question data folder'])
+
+    # collect fixation  data for all subjects as well as exclusion stats,
+    # one subject at a time while the R table is written
+    all_subj_data = compute_subj_data(subj_files, table_of_regions,
+        answer_key, cutoffs, measure_engine, arguments, cache_dir=cache_dir)
+
+    if arguments.incremental and len(changed) < len(digests):
+        # write the new rows to separate files, then splice them into the
+        # existing R table and exclusion counts
+        partial_output = file_names['Output filename'] + '.partial'
+        partial_exclusions = exclusion_file + '.partial'
+        # the codes file belongs to the whole R table, not the partial one
+        write_R_table(all_subj_data, partial_output, partial_exclusions,
+            word_dict, wide=arguments.wide, codes=arguments.codes,
+            measures=arguments.measures,
+            codes_output=file_names['Output filename'])
+        all_subjects = [subj for subj, f_path, q_path in all_subj_files]
+        splice_table(file_names['Output filename'], partial_output,
+            file_names['Output filename'], all_subjects, changed, '\t')
+        splice_table(exclusion_file, partial_exclusions,
+            exclusion_file, all_subjects, changed, ',')
+        os.remove(partial_output)
+        os.remove(partial_exclusions)
+    else:
+        write_R_table(all_subj_data, file_names['Output filename'],
+            exclusion_file, word_dict, wide=arguments.wide,
+            codes=arguments.codes, measures=arguments.measures)
+
+    if arguments.incremental:
+        write_manifest(file_names['Output filename'], exclusion_file,
+            settings, digests)
+
+    # keep the cache of parsed files from growing without bounds
+    evict_cache(cache_dir, arguments.cache_size)
+    write_profile(arguments.profile, file_names['Output filename'])
+
+
+# name of the file with the exclusion counts for all subjects
+EXCLUSION_FILE_NAME = 'excluded_fixation_counts.csv'
+
+
+def exclusion_file_name(output_file):
+    '''Returns the name of the file with the exclusion counts for an R table,
+    which is compressed in the same way as the R table, e.g.
+    "out.txt.gz" -> "excluded_fixation_counts.csv.gz".
+    '''
+    if compression_codec(output_file):
+        return EXCLUSION_FILE_NAME + os.path.splitext(output_file)[1]
+    return EXCLUSION_FILE_NAME
+
+
+def compute_subj_data(subj_files, table_of_regions, answer_key, cutoffs,
+                      engine, arguments, cache_dir=None):
+    '''Processes all subjects in the way selected by the command line options
+    and yields a (rows, exclusions) pair for every subject with fixation data.
+    subj_files are (subject_number, sentence_path, question_path) tuples as
+    returned by create_subj_files(). The files of a subject are only read
+    when the subject is processed, and subjects are only processed as their
+    pairs are asked for, so only the subject being written has to be kept
+    in memory.
+    '''
+    # reads the files of one subject, see load_subj()
+    loader = partial(load_subj, compact=arguments.compact, cache_dir=cache_dir)
+    if arguments.stream:
+        subj_data = process_subj_stream(subj_files, table_of_regions,
+            answer_key, cutoffs, engine=engine)
+    elif arguments.workers > 1:
+        subj_data = process_subj_parallel(subj_files, table_of_regions,
+            answer_key, cutoffs, engine=engine, workers=arguments.workers,
+            loader=loader)
+    else:
+        subj_data = process_subj(subj_files, table_of_regions, answer_key,
+            cutoffs, engine=engine, loader=loader)
+    subj_count = 0
+    for subj_count, subj_pair in enumerate(subj_data, 1):
+        yield subj_pair
+    print('Done processing. Created data for {0} subjects.'.format(subj_count))
+
+
+def start_profiling():
+    '''Turns on profiling for --profile in this process (see profiling.py)
+    and starts counting calls of region_check().
+    '''
+    profiling.enable()
+    # the compiled regions (see eye_measures.RegionLayout) only fall back to
+    # region_check() for unusual layouts, so this is often 0
+    profiling.count('region_check calls', 0)
+    profiling.count_calls(eye_measures, 'region_check', 'region_check calls')
 
-    write_to_table(file_names['Output filename'],
-        flattened_subj_rows,
-        header=fixation_table_header,
-        delimiter='\t',
-        restval=' ')
+
+def write_profile(profile_file, output_file):
+    '''Writes the --profile report to profile_file, or next to the R table
+    ("OUTPUT.profile.json") if no file name was given. Does nothing if
+    profiling is off.
+    '''
+    if not profiling.enabled():
+        return
+    results = profiling.report()
+    counters = results['counters']
+    measures_time = results['stages'].get('measures', {}).get('wall')
+    rates = {
+        'fixations per second': profiling.rate(counters.get('fixations', 0),
+            measures_time),
+        'trials per subject': (counters.get('trials', 0) / counters['subjects']
+            if counters.get('subjects') else None),
+    }
+    profiling.write_report(profile_file or output_file + '.profile.json', rates)
+
+
+def make_tables(region_files, output_files, cutoff_grid, tables_by_subj,
+                answer_key, engine, cache_dir=None, wide=False, codes=False,
+                measures=MEASURE_NAMES):
+    '''Writes one R table for every REG (or DEL) file in region_files and every
+    (low, high) pair of cutoffs in cutoff_grid, all from the same subject data.
+    Subject files are read and regions are looked up only once, and every
+    region file is parsed only once (or loaded from the cache in cache_dir). Filtering and
+    exclusion counts are repeated for every pair of cutoffs, and only the
+    measures are computed for every combination of regions and cutoffs.
+    The R table for region_files[i] is written to output_files[i]. If there
+    are several pairs of cutoffs, they are added to the names of the R tables
+    and of the exclusion count files, e.g. "name_40-1000.txt".
+    The exclusion counts do not depend on the regions, so they are written
+    once for every pair of cutoffs.
+    "wide", "codes" and "measures" select the layout of the R tables, see
+    write_R_table().
+    '''
+    tables_by_subj = tuple(tables_by_subj)
+    # regions of every trial of every subject and the words of every region,
+    # for every set of regions
+    subj_regions = []
+    word_dicts = []
+    for regions_file in region_files:
+        with profiling.stage('region table'):
+            table_of_regions, word_dict = load_regions(regions_file, cache_dir)
+            table_of_regions = compile_region_table(table_of_regions)
+        subj_regions.append(dict((subj_number, load_subj_regions(table_of_regions, f_table))
+            for subj_number, f_table, q_table in tables_by_subj if f_table))
+        word_dicts.append(word_dict)
+
+    for cutoffs in cutoff_grid:
+        prepared = tuple(prepare_subj(tables_by_subj, answer_key, cutoffs))
+        excl_file_name = cutoff_file_name(exclusion_file_name(output_files[0]),
+            cutoffs, cutoff_grid)
+        for regions_file, output_file, regions_by_subj, word_dict in zip(
+                region_files, output_files, subj_regions, word_dicts):
+            output_file = cutoff_file_name(output_file, cutoffs, cutoff_grid)
+            print('Generating {0} for {1}'.format(output_file, regions_file))
+            all_subj_data = tuple(
+                (measures_per_trial(subj_number, all_trial_fields,
+                    regions_by_subj[subj_number], filtered_fixations,
+                    engine=engine), exclusions)
+                for subj_number, f_table, all_trial_fields, filtered_fixations,
+                    exclusions in prepared)
+            write_R_table(all_subj_data, output_file, excl_file_name,
+                word_dict, wide=wide, codes=codes, measures=measures)
+            # the exclusion counts are the same for all sets of regions
+            excl_file_name = None
+
+
+def cutoff_file_name(file_name, cutoffs, cutoff_grid):
+    '''Adds the cutoffs to a file name ("name.txt" -> "name_40-1000.txt"),
+    but only if there are several pairs of cutoffs in the grid.
+    '''
+    if len(cutoff_grid) < 2:
+        return file_name
+    root, extension = split_extension(file_name)
+    return '{0}_{1}-{2}{3}'.format(root, cutoffs[0], cutoffs[1], extension)
+
+
+def write_R_table(all_subj_data, output_file, excl_file_name, word_dict,
+                  wide=False, codes=False, measures=MEASURE_NAMES,
+                  codes_output=None):
+    '''Writes the rows of all subjects to the R table, adding the words of
+    every region (from word_dict, see load_regions()) to them on the way, and
+    writes the exclusion counts of all subjects to a separate file (unless
+    excl_file_name is None).
+    If "wide" is True, the R table has one row per region of every trial with
+    one column per measure, instead of one row per measure.
+    If "codes" is True, the text columns (words and fixationtype) contain
+    integer codes instead, which are listed in a separate file, see
+    codes_file_name(). The codes file is named after codes_output instead of
+    output_file if it is given, e.g. when output_file is only a part of the
+    R table that is spliced into codes_output later.
+    "measures" are the names of the measures in the rows, in their order
+    (see --measures and get_measure_engine()).
+    '''
+    # split subject data into fixation information and exclusion statistics.
+    # The rows of all subjects are turned into one flat sequence of rows,
+    # and the exclusions of every subject are collected on the way, so that
+    # subjects can be processed while their rows are written
+    subj_exclusions = []
+    flattened_subj_rows = profiling.timed_iter('row building',
+        rows_collecting_exclusions(all_subj_data, subj_exclusions))
+    if wide:
+        flattened_subj_rows = wide_rows(flattened_subj_rows, len(measures))
+        fixation_table_header = REGION_COLUMNS + list(measures)
+    else:
+        fixation_table_header = REGION_COLUMNS + ['fixationtype', 'value']
+    # add word information to the rows as they are written
+    print("Adding word information...")
+    rows_with_words = profiling.timed_iter('word merge',
+        add_word_columns(flattened_subj_rows, word_dict))
+    fixation_table_header += WORD_COLUMNS
+
+    if codes:
+        column_codes = make_column_codes(word_dict, wide, measures)
+        codes_file = codes_file_name(codes_output or output_file)
+        print('Writing the codes of text columns to *{0}*'.format(codes_file))
+        write_column_codes(codes_file, column_codes)
+        rows_with_words = encode_columns(rows_with_words,
+            fixation_table_header, column_codes)
+
+    # write the header and the rows to file
+    with profiling.stage('writing'):
+        write_to_table(output_file,
+            rows_with_words,
+            header=fixation_table_header,
+            delimiter='\t',
+            restval=' ')
 
     # now define exclusion header and exclusion file name, then write to it
     exclusion_table_header = [
@@ -126,27 +391,255 @@ def main():
     'Total'
     ]
     
-    excl_file_name = 'excluded_fixation_counts.csv'
-    print('Writing statistics of exclusions to *{0}*'.format(excl_file_name))
-    write_to_table(excl_file_name,
-        subj_exclusions,
-        header=exclusion_table_header)
-        
-    # add word information in the table
-    # Two last arguments are the same: the first tells us from which file
-    # to read the R table, the second one - where to write the modified
-    # table. Thus here we over-write the table file.
-    add_words(file_names['REG (or DEL) filename'],
-        file_names['Output filename'],
-        file_names['Output filename'])
-        
-    
+    if excl_file_name:
+        print('Writing statistics of exclusions to *{0}*'.format(excl_file_name))
+        write_to_table(excl_file_name,
+            subj_exclusions,
+            header=exclusion_table_header)
+
+
+def rows_collecting_exclusions(all_subj_data, subj_exclusions):
+    '''Given (rows, exclusions) pairs yields the rows of all subjects one after
+    another, and appends the exclusions of every subject to subj_exclusions
+    as soon as its rows are reached.
+    '''
+    for subj_rows, exclusions in all_subj_data:
+        subj_exclusions.append(exclusions)
+        yield from subj_rows
+
+
+# columns of the R table that describe the region, before the measures
+REGION_COLUMNS = [
+    'subj',
+    'order',
+    'cond',
+    'item',
+    'questionRT',
+    'questionAcc',
+    'region',
+    'Xstart',
+    'Xend',
+    'Ystart',
+    'Yend',
+]
+
+
+def wide_rows(rows, measure_count=len(MEASURE_NAMES)):
+    '''Turns rows with one measure each, as measures_per_trial() yields them,
+    into rows with all the measures of a region, in the order of MEASURE_NAMES
+    (or of the measures selected with --measures).
+    measures_per_trial() always yields the measures of a region one after
+    another in that order, so every measure_count rows make one new row.
+    '''
+    rows = iter(rows)
+    for first_row in rows:
+        # drop the measure name and keep the value of every row
+        values = (first_row[-1],) + tuple(row[-1]
+            for row in islice(rows, measure_count - 1))
+        yield first_row[:-2] + values
+
+
+def make_column_codes(word_dict, wide, measures=MEASURE_NAMES):
+    '''Returns a tuple of (column_name, {value: code}) pairs for the text
+    columns of the R table. Codes start from 1 and only depend on the
+    regions and the layout of the table, not on the subjects, so tables
+    written with the same region file always use the same codes.
+    The built-in measures keep their codes whichever of them are selected
+    with --measures; other registered measures are numbered after them.
+    '''
+    column_codes = []
+    if not wide:
+        measure_names = MEASURE_NAMES + tuple(name for name in measures
+            if name not in MEASURE_NAMES)
+        column_codes.append(('fixationtype', number_values(measure_names)))
+    column_codes.append(('words', number_values(sorted(set(word_dict.values())))))
+    return tuple(column_codes)
+
+
+def number_values(values):
+    '''Gives every value an integer code, counting from 1.'''
+    return dict((value, code) for code, value in enumerate(values, 1))
+
+
+def encode_columns(rows, header, column_codes):
+    '''A generator that replaces the values in the columns listed in
+    column_codes (see make_column_codes()) with their codes.
+    '''
+    positions = tuple((header.index(column), codes)
+        for column, codes in column_codes)
+    for row in rows:
+        row = list(row)
+        for position, codes in positions:
+            row[position] = codes[row[position]]
+        yield row
+
+
+def codes_file_name(output_file):
+    '''Returns the name of the file with the codes for an R table
+    ("name.txt" -> "name_codes.txt").
+    '''
+    root, extension = split_extension(output_file)
+    return root + '_codes' + extension
+
+
+def write_column_codes(file_name, column_codes):
+    '''Writes a table of (column, code, value) rows, which can be merged
+    with the R table in R to get the text back.
+    '''
+    rows = ((column, code, value)
+        for column, codes in column_codes
+        for value, code in sorted(codes.items(), key=lambda pair: pair[1]))
+    write_to_table(file_name, rows, header=['column', 'code', 'value'],
+        delimiter='\t')
+
+
+def output_settings(file_names, cutoffs, arguments):
+    '''Collects everything other than the DA1 files that affects the contents
+    of the R table, so that incremental runs can tell whether the existing
+    table was made with the same settings.
+    '''
+    return {
+        'cutoffs': list(cutoffs),
+        'wide': arguments.wide,
+        'codes': arguments.codes,
+        'measures': list(arguments.measures),
+        'regions': file_digest(file_names['REG (or DEL) filename']),
+        'question_key': file_digest(file_names['Question key filename']),
+    }
 
 
 ###########################################################
 ## Interacting with the user
 ###########################################################
 
+def parse_arguments(argv=None):
+    '''Defines and reads the command line options of this script.
+    None of the options are required: all the file names are still asked
+    for interactively.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--engine',
+        choices=sorted(MEASURE_ENGINES),
+        default='python',
+        help='how to compute the measures: "python" (default) or "numpy", '
+            'which requires NumPy to be installed')
+    parser.add_argument('--cross-check',
+        action='store_true',
+        help='compute the measures with the numpy engine AND with the '
+            'functions from eye_measures, stopping if they ever disagree (slow)')
+    parser.add_argument('--workers',
+        type=int,
+        default=1,
+        metavar='N',
+        help='process N subjects at the same time in separate processes '
+            '(default: 1, everything in this process)')
+    parser.add_argument('--stream',
+        action='store_true',
+        help='read the sentence DA1 files one trial at a time instead of '
+            'loading all of them first, to keep memory use low')
+    parser.add_argument('--compact',
+        action='store_true',
+        help='store fixations in compact arrays instead of Python tuples, '
+            'which takes much less memory')
+    parser.add_argument('--no-cache',
+        action='store_true',
+        help='always parse the DA1 files, without using or updating '
+            'the cache of parsed files')
+    parser.add_argument('--cache-dir',
+        metavar='DIR',
+        help='folder for the cache of parsed DA1 files '
+            '(default: {0})'.format(default_cache_dir()))
+    parser.add_argument('--cache-size',
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        metavar='MB',
+        help='delete the least recently used cached files once the cache '
+            'is bigger than this (default: {0} MB)'.format(DEFAULT_CACHE_SIZE))
+    parser.add_argument('--incremental',
+        action='store_true',
+        help='only process subjects whose DA1 files changed since the output '
+            'file was last generated with this option and splice their rows '
+            'into it')
+    parser.add_argument('--cutoffs',
+        nargs='+',
+        type=cutoff_pair,
+        metavar='LOW:HIGH',
+        help='use these cutoffs instead of asking for them; with several '
+            'pairs (e.g. 40:1000 80:800) one R table is written per pair')
+    parser.add_argument('--variants',
+        nargs='+',
+        metavar='FILE',
+        help='write one R table for each of these REG (or DEL) files, '
+            'reading the DA1 files only once; the table for "name.del" is '
+            'written to "name.txt"')
+    parser.add_argument('--wide',
+        action='store_true',
+        help='write one row per region of every trial with one column per '
+            'measure, instead of one row per measure')
+    parser.add_argument('--codes',
+        action='store_true',
+        help='write integer codes instead of the words (and measure names) '
+            'and list the codes in a separate "OUTPUT_codes.txt" file')
+    parser.add_argument('--measures',
+        type=measure_list,
+        default=MEASURE_NAMES,
+        metavar='NAME,...',
+        help='only write these measures, in this order, e.g. '
+            'fp,rp,tt (default: {0})'.format(','.join(MEASURE_NAMES)))
+    parser.add_argument('--profile',
+        nargs='?',
+        const='',
+        metavar='FILE',
+        help='report the time and memory spent in every stage, and counts '
+            'of trials, fixations etc., in FILE (by default '
+            '"OUTPUT.profile.json" next to the R table)')
+    arguments = parser.parse_args(argv)
+    if arguments.workers < 1:
+        parser.error('--workers has to be at least 1')
+    if arguments.stream and arguments.workers > 1:
+        parser.error('--stream cannot be combined with --workers')
+    if arguments.stream and arguments.compact:
+        parser.error('--stream cannot be combined with --compact')
+    several_tables = arguments.variants or len(arguments.cutoffs or ()) > 1
+    if several_tables:
+        # options that only work when a single R table is written
+        chosen = (('stream', arguments.stream),
+                  ('workers', arguments.workers > 1),
+                  ('incremental', arguments.incremental))
+        for option, is_chosen in chosen:
+            if is_chosen:
+                parser.error('--variants and several --cutoffs cannot be '
+                    'combined with --' + option)
+    return arguments
+
+
+def cutoff_pair(text):
+    '''Converts a "LOW:HIGH" string from the command line to a pair of
+    integer cutoffs.
+    '''
+    try:
+        low_cutoff, high_cutoff = map(int, text.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'cutoffs should look like 40:1000, not "{0}"'.format(text))
+    return (low_cutoff, high_cutoff)
+
+
+def measure_list(text):
+    '''Converts a comma-separated list of measure names from the command line
+    (e.g. "fp,rp,tt") to a tuple of names, each of which has to be registered
+    in eye_measures (see register_measure()).
+    '''
+    names = tuple(name.strip() for name in text.split(',') if name.strip())
+    unknown = [name for name in names if name not in MEASURES]
+    if unknown or not names:
+        raise argparse.ArgumentTypeError(
+            'unknown measures "{0}", the measures are: {1}'.format(
+                ','.join(unknown), ', '.join(MEASURES)))
+    # every measure only once, in the order given
+    return tuple(dict.fromkeys(names))
+
+
 CUTOFF_PROMPT = ('The current cutoff settings are as follows.',
     'low: {0} ms',
     'high: {1} ms',
@@ -184,97 +677,170 @@ def verify_cutoff_values(low_cutoff, high_cutoff, prompt=CUTOFF_PROMPT):
 ## Creating fixation and question tables for subjects
 ###########################################################
 
-def create_subj_tables(sentence_dir, question_dir):
-    '''Given folder names for sentences and questions returns a list of
-    (subject_number, fixation_table, question_table) tuples.
-    This is achieved by first creating two dictionaries, one for fixation files
-    and one for question files. Both are indexed by subject numbers.
-    '''
-    # dictionaries of (subj_n: table) pairings
-    fixation_paths = load_subj_tables(sentence_dir, 'fixations')
-    question_paths = load_subj_tables(question_dir, 'questions')
-    # start out by listing all the subjects present in both dictionaries
-    all_data = [(subj, f_table, question_paths[subj])
-                    for subj, f_table in fixation_paths.items()
+def create_subj_tables(sentence_dir, question_dir, compact=False,
+                       cache_dir=None):
+    '''Given folder names for sentences and questions returns an iterator
+    of (subject_number, fixation_table, question_table) tuples.
+    This is achieved by first finding the files of every subject with
+    create_subj_files(). The files of a subject are only read (with
+    load_subj()) when the iterator gets to that subject, so a subject that
+    has been processed does not have to stay in memory.
+    If "compact" is True, fixations are stored in arrays (see
+    util.read_fixation_arrays()) instead of tuples.
+    If "cache_dir" is given, parsed files are cached there (see
+    util.read_cached()).
+    '''
+    # (subj_n, sentence_path, question_path) for all subjects, in the order
+    # of subjects with both files, only sentences, only questions
+    with profiling.stage('file discovery'):
+        subj_files = create_subj_files(sentence_dir, question_dir)
+    return map(partial(load_subj, compact=compact, cache_dir=cache_dir),
+        subj_files)
+
+
+def tables_from_sorted_da1(sorted_da1s, compact=False):
+    '''Given a list of (subject_number, sentences, questions, rejects) tuples
+    as returned by sort_da1.sort_da1_data() returns the same list as
+    create_subj_tables() would for the folders written from that data by
+    sort_da1.write_da1(), without writing or reading any files.
+    '''
+    make_fixation_table = compact_fixation_table if compact else fixation_table
+    # write_da1() only writes files for non-empty lists; sort_da1_data() has
+    # one entry per subject, since subject_da1_files() drops repeated subjects
+    fixation_lines = dict((subj, sents) for subj, sents, questions, rejects
+        in sorted_da1s if sents)
+    question_lines = dict((subj, questions) for subj, sents, questions, rejects
+        in sorted_da1s if questions)
+    subj_files = [(subj, subj in fixation_lines, subj in question_lines)
+        for subj in dict.fromkeys(subj for subj, s, q, r in sorted_da1s)]
+    # same order as in create_subj_tables()
+    ordered = [subj for subj, has_f, has_q in subj_files if has_f and has_q]
+    ordered += [subj for subj, has_f, has_q in subj_files if has_f and not has_q]
+    ordered += [subj for subj, has_f, has_q in subj_files if has_q and not has_f]
+    all_data = []
+    for subj in ordered:
+        f_table = q_table = None
+        if subj in fixation_lines:
+            f_table = make_fixation_table(fixation_lines[subj])
+        if subj in question_lines:
+            q_table = question_table(question_lines[subj])
+        all_data.append((subj, f_table, q_table))
+    return all_data
+
+
+def create_subj_files(sentence_dir, question_dir):
+    '''Same as create_subj_tables(), but returns a list of
+    (subject_number, sentence_file_path, question_file_path) tuples
+    without reading any of the files.
+    '''
+    fixation_paths = find_subj_files(sentence_dir)
+    question_paths = find_subj_files(question_dir)
+    all_files = [(subj, f_path, question_paths[subj])
+                    for subj, f_path in fixation_paths.items()
                     if subj in question_paths]
-    # add subjects who only have fixation files for them
-    all_data += [(subj, f_table, None)
-                    for subj, f_table in fixation_paths.items()
+    all_files += [(subj, f_path, None)
+                    for subj, f_path in fixation_paths.items()
                     if subj not in question_paths]
-    # add also subjects who only have question files associated with them
-    all_data += [(subj, None, q_table)
-                    for subj, q_table in question_paths.items()
+    all_files += [(subj, None, q_path)
+                    for subj, q_path in question_paths.items()
                     if subj not in fixation_paths]
-    return all_data
+    return all_files
 
 
-def load_subj_tables(directory, table_type):
-    '''Takes a directory and a string description of which table type to
-    load.
-    Creates a sequence of file paths for all DA1 files in the directory.
-    Extracts subject numbers from the paths, then converts the file paths
-    to corresponding tables. Whether fixation or question tables are loaded
-    is determined by the "table_type" argument.
-    Pairs up the subject numbers with the file names, then turns these pairings
-    into a dictionary which is returned.
+def find_subj_files(directory):
+    '''Returns a dictionary of (subject_number : file_path) pairings for all
+    DA1 files in the directory.
     '''
-    # use function from util module to generate file paths keeping only DA1 files
     file_paths = tuple(gen_file_paths(directory, filter_func=is_DA1_file))
-    # from these file paths get subject numbers
-    subj_numbers = map(get_subj_num, file_paths)
-    if table_type is 'fixations':
-        tables = map(read_fixation_table, file_paths)
-    elif table_type is 'questions':
-        tables = map(read_question_table, file_paths)
-    else:
-        # if the table type is unrecognizable, inform user and stop the program
-        error = 'Not sure what to do with this table type: {0}\nCheck your code!'
-        raise Exception(error.format(table_type))
-    # if tables for subjects loaded, combine them with subject numbers using
-    # zip() and turn the resulting list of tuples into a dictionary
-    return dict(zip(subj_numbers, tables))
+    return dict(zip(map(get_subj_num, file_paths), file_paths))
+
+
+def load_subj(subj_file, compact=False, cache_dir=None):
+    '''Given a (subject_number, sentence_path, question_path) tuple as returned
+    by create_subj_files() reads the files and returns a
+    (subject_number, fixation_table, question_table) tuple.
+    '''
+    subj, f_path, q_path = subj_file
+    fixation_reader = read_fixation_arrays if compact else read_fixation_table
+    with profiling.stage('DA1 parse'):
+        f_table = f_path and read_cached(fixation_reader, f_path, cache_dir)
+        q_table = q_path and read_cached(read_question_table, q_path, cache_dir)
+    return (subj, f_table, q_table)
+
+
+def subj_file_size(subj_file):
+    '''Given a (subject_number, sentence_path, question_path) tuple returns
+    the size of the sentence file in bytes, which tells how big a subject is
+    before its files are read.
+    '''
+    subj, f_path, q_path = subj_file
+    if not f_path:
+        return 0
+    return os.path.getsize(f_path)
+
+
+def read_answer_key(file_name):
+    '''Reads the question key file into a dictionary of
+    (condition, item) : line_of_the_file pairings.
+    '''
+    # THE TWO LINES BELOW ARE COMMENTED BECAUSE THEY DON'T WORK CORRECTLY.
+    # THE LINE BELOW THEM IS A QUICK FIX (ALSO SEE question_info()).
+    #answer_key = dict_from_table(read_table(file_name), paired=False)
+    return dict_from_table(tag_table(read_table(file_name), 0, 1))
 
 
 ###########################################################
 ## Making/Loading a .reg file
 ###########################################################
 
-def get_region_table(file_name):
-    '''Given a file name returns a region table.
-    If the file name ends with .reg, loads the region table from that directly.
-    If the file name ends with .del, uses that to create a .reg file and loads
-    the latter.
+def load_regions(file_name, cache_dir=None):
+    '''Given a REG (or DEL) file name returns a (region_table, word_dict) pair,
+    where word_dict is the same as mergewords.make_word_dict() returns.
+    A .del file is read only once for both of them, and the .reg file made from
+    it is written for later use but not read back in. If cache_dir is given,
+    the parsed .del file is also kept there, so it is only parsed again once
+    its contents change.
     '''
     if '.reg' in file_name:
         print('This looks like a region file. I can load it directly')
-        return read_region_table(file_name, 0, 1)
+        return read_region_table(file_name, 0, 1), make_word_dict(file_name)
     elif '.del' in file_name:
         print('This looks like a .del file. I will turn it into a region file.')
-        region_data = make_regions(file_name)
+        region_data, table_of_regions, word_dict = read_cached(read_del_file,
+            file_name, cache_dir)
         print('Successfully generated region data from DEL file.')
         reg_file_name = file_name.split('.del')[0] + '.reg'
         write_to_table(reg_file_name, region_data, delimiter=' ')
         print('Saved region data to "{0}"'.format(reg_file_name))
-        return read_region_table(reg_file_name, 0, 1)
+        return table_of_regions, word_dict
+    error = 'Not sure what to do with this region file: {0}\nIt should be a .reg or a .del file.'
+    raise Exception(error.format(file_name))
 
 
-def make_regions(del_file_name):
-    '''A generator function that, given a .del file name opens the file and loops
-    over its lines, yielding tuples of the following form:
-    (condition, item#, region_indeces)
+def read_del_file(del_file_name):
+    '''Reads a .del file in one go and returns a tuple of:
+    - the lines of the corresponding .reg file, (condition, item) followed by
+      what get_region_indices() returns for the item's lines
+    - the region table, the same as read_region_table() returns for that .reg file
+    - the word dictionary, the same as mergewords.make_word_dict() returns
     '''
-    with open(del_file_name) as del_file:
-        split_lines = [line.strip().split(' ') for line in del_file]
-    for line in split_lines:
-        # convert item information to strings for later writing
-        item_info = (str(line[0]), str(line[1]))
-        # combine the rest of the line into one string and then split it
-        # by the special '\\n' symbol
-        # this is used for items that span multiple lines during presentation
-        item_sents = ' '.join(line[2:]).split('\\n')
-        # use the result to get a list of indeces
-        reg_indeces = get_region_indices(item_sents)
-        yield item_info + reg_indeces
+    region_data = []
+    table_of_regions = {}
+    word_dict = {}
+    with open_table_file(del_file_name) as del_file:
+        for line in del_file:
+            line = line.strip().split(' ')
+            tag = (line[0], line[1])
+            item_text = ' '.join(line[2:])
+            reg_indices = get_region_indices(item_text.split('\\n'))
+            region_data.append(tag + reg_indices)
+            # same as region_coordinates() does with the line of the .reg file
+            coordinates = tuple(zip(map(int, reg_indices[1::2]),
+                                    map(int, reg_indices[2::2])))
+            table_of_regions[tag] = tuple(zip(coordinates[:-1], coordinates[1:]))
+            for count, words in enumerate(region_words(item_text)):
+                word_dict[tag + (str(count),)] = words
+    return tuple(region_data), table_of_regions, word_dict
 
 
 _SLASH_RGX = re.compile('/')
@@ -320,10 +886,37 @@ def get_region_indices(sentences):
 ## Per/Subject operations
 ###########################################################
 
-def process_subj(subjects, table_of_regions, answer_key, cutoffs):
+def process_subj(subjects, table_of_regions, answer_key, cutoffs,
+                 engine=trial_measures, loader=None):
     '''This function takes a subject number with corresponding fixation and
     question table and constructs a list of tuples to be transformed into
     rows of the output file.
+    The "engine" argument is the function used to compute the measures for
+    every trial, see get_measure_engine().
+    If a "loader" (such as load_subj()) is given, subjects are
+    (subject_number, sentence_path, question_path) tuples instead, and the
+    loader reads the files of every subject right before it is processed.
+    '''
+    if loader:
+        subjects = map(loader, subjects)
+    prepared = prepare_subj(subjects, answer_key, cutoffs)
+    for subj_number, f_table, all_trial_fields, filtered_fixations, exclusions in prepared:
+        # use table of regions to load per/trial regions for this subject
+        regions = load_subj_regions(table_of_regions, f_table)
+
+        # use trial fields, regions and filtered fixations to get the measures
+        subj_data = measures_per_trial(subj_number, all_trial_fields,
+            regions, filtered_fixations, engine=engine)
+        # yield measures paired up with exclusions
+        yield (subj_data, exclusions)
+
+
+def prepare_subj(subjects, answer_key, cutoffs):
+    '''Does everything process_subj() does that does not depend on the regions:
+    combines trial information with question accuracy and RT, filters the
+    fixations and counts the exclusions.
+    For every subject with fixation data yields a tuple of the form:
+    (subject_number, fixation_table, trial_fields, filtered_fixations, exclusions)
     '''
     for subj_number, f_table, q_table in subjects:
         print('Processing subject #' + subj_number)
@@ -334,26 +927,165 @@ def process_subj(subjects, table_of_regions, answer_key, cutoffs):
             # compute question accuracy and get question RT
             q_acc_RT = question_info(f_table, q_table, answer_key)
             # combine trial info with question accuracy and RT
-            all_trial_fields = (t + q for t, q in zip(trials, q_acc_RT))
-
-            # make sure only fixations inside cutoffs are kept
-            filtered_fixations = tuple(filter_fixations(cutoffs, fixations))
-            # count the number of fixations excluded through filtering
-            exclusions = count_exclusions(subj_number,
-                filtered_fixations,
-                fixations)
-            # use table of regions to load per/trial regions for this subject
-            regions = load_subj_regions(table_of_regions, f_table)
-
-            # use trial fields, regions and filtered fixations to get the measures
-            subj_data = measures_per_trial(subj_number, all_trial_fields,
-                regions, filtered_fixations)
-            # yield measures paired up with exclusions
+            all_trial_fields = tuple(t + q for t, q in zip(trials, q_acc_RT))
+
+            with profiling.stage('filtering'):
+                # make sure only fixations inside cutoffs are kept
+                filtered_fixations = tuple(filter_fixations(cutoffs, fixations))
+                # count the number of fixations excluded through filtering
+                exclusions = count_exclusions(subj_number,
+                    filtered_fixations,
+                    fixations)
+            profiling.count('subjects')
+            yield (subj_number, f_table, all_trial_fields, filtered_fixations,
+                exclusions)
+        else:
+            print('Found no fixation data for subject. Skipping.')
+
+
+def process_subj_parallel(subjects, table_of_regions, answer_key, cutoffs,
+                          engine=trial_measures, workers=2, loader=None):
+    '''Does the same as process_subj(), but processes several subjects at the
+    same time in a pool of "workers" processes.
+    The biggest subjects (those with the most fixations) are started first so
+    that no process is left working on a big subject when the others are done.
+    The results are still returned in the same order as by process_subj().
+    With a "loader" (see process_subj()) the files of every subject are read
+    by the worker process that handles it, and the biggest subjects are
+    those with the biggest sentence files.
+    '''
+    subjects = list(subjects)
+    size = subj_file_size if loader else subj_size
+    biggest_first = sorted(range(len(subjects)),
+        key=lambda index: size(subjects[index]),
+        reverse=True)
+    # the settings are the same for all subjects, so we send them to every
+    # process only once, when it starts
+    settings = (table_of_regions, answer_key, cutoffs, engine, loader,
+        profiling.enabled())
+    with ProcessPoolExecutor(max_workers=workers,
+            initializer=_init_worker, initargs=settings) as executor:
+        futures = {}
+        for index in biggest_first:
+            futures[index] = executor.submit(_process_one_subj, subjects[index])
+        # collect the results in the original order of subjects
+        for index in range(len(subjects)):
+            result, recorded = futures[index].result()
+            # add what the worker recorded for --profile to our own profile
+            profiling.merge(recorded)
+            if result:
+                yield result
+
+
+def subj_size(subject):
+    '''Given a (subject_number, fixation_table, question_table) tuple returns
+    the total number of fixations of the subject.
+    '''
+    subj_number, f_table, q_table = subject
+    if not f_table:
+        return 0
+    return sum(len(fixations) for order_etc, fixations in f_table.values())
+
+
+# settings shared by all subjects in a worker process, see _init_worker()
+_WORKER_SETTINGS = None
+
+def _init_worker(*settings):
+    '''Runs once in every worker process started by process_subj_parallel()
+    and stores the settings used for processing subjects.
+    '''
+    global _WORKER_SETTINGS
+    _WORKER_SETTINGS = settings[:-1]
+    if settings[-1]:
+        start_profiling()
+
+
+def _process_one_subj(subject):
+    '''Runs in a worker process. Processes one subject with process_subj()
+    and returns its (rows, exclusions) pair, or None if the subject had no
+    fixation data, together with what was recorded for --profile (if
+    profiling is on).
+    '''
+    table_of_regions, answer_key, cutoffs, engine, loader = _WORKER_SETTINGS
+    result = None
+    for subj_data, exclusions in process_subj([subject], table_of_regions,
+            answer_key, cutoffs, engine=engine, loader=loader):
+        # rows have to be computed here, not in the main process
+        result = (tuple(subj_data), exclusions)
+    return result, profiling.take()
+
+
+def process_subj_stream(subj_files, table_of_regions, answer_key, cutoffs,
+                        engine=trial_measures):
+    '''Streaming version of process_subj(). Takes the output of
+    create_subj_files() and reads every subject's sentence file only while
+    its rows are being written, one trial at a time.
+    Just like process_subj(), yields (rows, exclusions) pairs for every subject
+    with fixation data. Since the file is only read as the rows are consumed,
+    the exclusion counts are a list that is filled in along the way: they
+    are complete once all the rows of the subject have been used up.
+    '''
+    for subj_number, f_path, q_path in subj_files:
+        print('Processing subject #' + subj_number)
+        if f_path:
+            print('Found fixation data for this subject, will compute measures.')
+            # question tables are small, so we load them as a whole
+            q_table = read_question_table(q_path) if q_path else None
+            exclusions = [subj_number, 0, 0]
+            subj_data = stream_trials(subj_number, f_path, q_table,
+                table_of_regions, answer_key, cutoffs, engine, exclusions)
             yield (subj_data, exclusions)
         else:
             print('Found no fixation data for subject. Skipping.')
 
 
+def stream_trials(subj_number, f_path, q_table, table_of_regions, answer_key,
+                  cutoffs, engine, exclusions):
+    '''Generator doing the work of process_subj_stream() for one subject:
+    reads one trial at a time from the file, filters its fixations, updates
+    the exclusion counts and yields the output rows for the trial.
+    The rows are the same as those of process_subj(): if the same
+    (condition, item) appears several times in the file, the last trial is
+    used, in the place of the first one, and trials are paired with regions
+    the same way (see load_subj_regions()). For that the (condition, item)
+    pairs of the file are read first, without parsing the fixations (see
+    util.da1_trial_keys()), and trials are only held back while an earlier
+    (condition, item) is still waiting for its last trial.
+    '''
+    profiling.count('subjects')
+    with profiling.stage('DA1 parse'):
+        trial_keys = da1_trial_keys(f_path)
+    regions = load_subj_regions(table_of_regions, trial_keys)
+    # place of every (condition, item) in the output
+    places = dict(zip(trial_keys, count()))
+    # trials that arrived before those in earlier places, by place
+    waiting = {}
+    next_place = 0
+    trials = profiling.timed_iter('DA1 parse', iter_fixation_trials(f_path))
+    for index, (cond_item, trial, fixations) in enumerate(trials):
+        if trial_keys[cond_item] != index:
+            condition, item = cond_item
+            print_message = 'Replacing repeated trial for condition: {0}, item: {1} with a later one'
+            print(print_message.format(condition, item))
+            continue
+        waiting[places[cond_item]] = (cond_item, trial, fixations)
+        while next_place in waiting:
+            cond_item, trial, fixations = waiting.pop(next_place)
+            # the one-trial versions of the steps in process_subj()
+            q_acc_RT = next(question_info((cond_item,), q_table, answer_key))
+            with profiling.stage('filtering'):
+                filtered, = filter_fixations(cutoffs, (fixations,))
+                excluded, total = count_exclusions(subj_number, (filtered,),
+                    (fixations,))[1:]
+            exclusions[1] += excluded
+            exclusions[2] += total
+            # process_subj() zips the trials with the regions that were found
+            if next_place < len(regions):
+                yield from measures_per_trial(subj_number, (trial + q_acc_RT,),
+                    (regions[next_place],), (filtered,), engine=engine)
+            next_place += 1
+
+
 def load_subj_regions(table_of_reg, f_table):
     '''Tries to load table of region entries for all (condition, item) tags in
     the table of fixations.
@@ -395,7 +1127,7 @@ def question_info(sentence_table, question_table, answer_key):
                 RT, subj_response = question_table[cond_item]
                 
                 # THE LINE BELOW IS COMMENTED BECAUSE IT DOESN'T WORK CORRECTLY.
-                # THE LINE BELOW IT IS A QUICK FIX (ALSO SEE LINE 76)
+                # THE LINE BELOW IT IS A QUICK FIX (ALSO SEE read_answer_key())
                 # correct_button = answer_key[item][0]
                 correct_button = answer_key[cond_item][3]
                 # check if subject responded correctly and convert that to int
@@ -421,50 +1153,114 @@ def filter_fixations(cutoffs, trials):
     # extract cutoffs
     low_cutoff, high_cutoff = cutoffs
     for trial_fixations in trials:
+        # compact fixations know how to filter themselves
+        if isinstance(trial_fixations, TrialFixations):
+            yield trial_fixations.filtered(low_cutoff, high_cutoff)
+            continue
         # each member of trial_fixations is a (X, Y, duration) tuple
         filtered = ((X, Y, duration) for X, Y, duration in trial_fixations
                                     if low_cutoff < duration < high_cutoff)
         yield tuple(filtered)
 
 
-def measures_per_trial(subj, trial_fields, region_list, trial_fixations):
+def measures_per_trial(subj, trial_fields, region_list, trial_fixations,
+                       engine=trial_measures):
     '''This function is really just a "fancy" wrapper for a very simple
     subsetting operation. We take the first 3 members of the trial list.
     '''
     subj_number = (subj,)
+    # the measures the engine computes, see get_measure_engine()
+    measure_names = getattr(engine, 'measure_names', MEASURE_NAMES)
+    binomial = binomial_measures(measure_names)
     for fields, regions, fixations in zip(trial_fields, region_list, trial_fixations):
-        for index, reg in enumerate(regions):
+        # compute the measures for all the regions of the trial at once
+        with profiling.stage('measures'):
+            all_measures = engine(regions, fixations)
+        profiling.count('trials')
+        profiling.count('fixations', len(fixations))
+        profiling.count('trial regions', len(regions))
+        for index, (reg, measures) in enumerate(zip(regions, all_measures)):
             reg_fields = (index + 1, reg[0][0], reg[1][0], reg[0][1], reg[1][1])
-            measures = region_measures(reg, fixations)
-            for measure in measures:
+            for m_name, raw_measure in zip(measure_names, measures):
+                measure = zero_to_NA(m_name, raw_measure, binomial)
                 yield subj_number + fields + reg_fields + measure
 
 
-def region_measures(region, fixations):
+# functions that compute all measures for a trial, by engine name
+MEASURE_ENGINES = {
+    'python': trial_measures,
+    'numpy': vector_measures.trial_measures,
+}
+
+
+def get_measure_engine(engine_name, cross_check=False, measures=MEASURE_NAMES):
+    '''Given the name of an engine returns the function that computes all the
+    measures for a trial. If cross_check is True, returns a function that
+    computes the measures with the numpy engine and verifies them against
+    the single-measure functions from eye_measures.
+    If "measures" are not exactly MEASURE_NAMES, the function is wrapped in a
+    MeasureSelection, which only returns those measures; its measure_names
+    tell measures_per_trial() which measures it gets.
+    '''
+    if cross_check or engine_name == 'numpy':
+        # stop right away if NumPy is missing, not once we reach the measures
+        vector_measures.require_numpy()
+    if cross_check:
+        engine = vector_measures.checked_trial_measures
+    else:
+        engine = MEASURE_ENGINES[engine_name]
+    if tuple(measures) != MEASURE_NAMES:
+        engine = MeasureSelection(engine, measures)
+    return engine
+
+
+class MeasureSelection(object):
+    '''Computes the measures "measure_names" for all regions of a trial with
+    an engine that computes MEASURE_NAMES in one pass (e.g. trial_measures()).
+    Unselected built-in measures are simply left out (the one-pass engines
+    compute all of them faster than compute_measures() computes even one), and
+    other registered measures are computed from the values of the built-in
+    ones, which are never computed twice (see eye_measures.compute_measures()).
+    A class rather than a closure, so that it can be sent to worker processes.
+    '''
+
+    def __init__(self, engine, measure_names):
+        self.engine = engine
+        self.measure_names = tuple(measure_names)
+        # positions of the selected measures among MEASURE_NAMES, or None if
+        # some of them have to be computed from those
+        if set(self.measure_names) <= set(MEASURE_NAMES):
+            self.positions = tuple(MEASURE_NAMES.index(name)
+                for name in self.measure_names)
+        else:
+            self.positions = None
+
+    def __call__(self, regions, fixations):
+        all_measures = self.engine(regions, fixations)
+        if self.positions is not None:
+            return [tuple(measures[position] for position in self.positions)
+                for measures in all_measures]
+        return [compute_measures(region, fixations, self.measure_names,
+                    known=dict(zip(MEASURE_NAMES, measures)))
+                for region, measures in zip(regions, all_measures)]
+
+
+def region_measures(region, fixations, measure_names=MEASURE_NAMES):
     '''Given a region and a list of fixations calculates all currently used
-    eye-tracking measures for the region.
+    eye-tracking measures for the region (or only those in measure_names).
     This is one more generator, it is defined to yield one measure at a time.
+    The measures come from the registry in eye_measures, so measures added
+    with register_measure() need no changes here, and values that several
+    measures need (e.g. total time for sf and rr) are only computed once.
+    measures_per_trial() uses eye_measures.trial_measures() instead, which
+    computes the same values for all regions of a trial in one pass.
     Please note that all continuous measures that equal zero are set to "NA" for
     ease of later processing with R.
     '''
-    # list below consists of "measure name": measure_function pairs
-    # measure functions are imported from eye_measures
-    measures = (
-    ('ff', first_fixation),
-    ('fp', first_pass),
-    ('fs', first_skip),
-    ('sf', single_fixation),
-    ('pr', prob_regression),
-    ('rp', regression_path),
-    ('rb', right_bound),
-    ('tt', total_time),
-    ('rr', rereading_time),
-    ('prr', prob_rereading),
-    )
-    binomial_measures = ('fs', 'pr', 'prr')
-    for m_name, m_calculator in measures:
-        raw_measure = m_calculator(region, fixations)
-        measure_to_NA = zero_to_NA(m_name, raw_measure, binomial_measures)
+    values = compute_measures(region, fixations, measure_names)
+    binomial = binomial_measures(measure_names)
+    for m_name, raw_measure in zip(measure_names, values):
+        measure_to_NA = zero_to_NA(m_name, raw_measure, binomial)
         yield measure_to_NA
 
 
@@ -0,0 +1,131 @@
+'''Functions for regenerating an R table only for those subjects whose DA1 files
+have changed since the table was last generated.
+generate_R_table.py stores a manifest next to the R table with a hash of
+every subject's DA1 files and of all the settings that affect the output
+(cutoffs, region file etc.). On the next run, only subjects whose files
+changed are processed again, and their rows are spliced into the existing
+R table and exclusion counts, which are compressed if the R table is (see
+generate_R_table.exclusion_file_name()). The result is exactly the same as
+when regenerating everything.
+'''
+
+# Structure:
+# 1. Imports
+# 2. Reading and writing manifests
+# 3. Finding out what changed
+# 4. Splicing tables
+
+###############################################################################
+## Imports
+###############################################################################
+
+import os, json
+from util import file_digest, open_table_file, split_extension
+
+# change this whenever the layout of the manifest changes
+_MANIFEST_VERSION = 1
+
+
+###############################################################################
+## Reading and writing manifests
+###############################################################################
+
+def manifest_path(output_file):
+    '''Returns the name of the manifest file for an R table.'''
+    return output_file + '.manifest.json'
+
+
+def read_manifest(output_file):
+    '''Returns the manifest stored for the R table, or None if there is no
+    (readable) manifest.
+    '''
+    try:
+        with open(manifest_path(output_file)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != _MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def write_manifest(output_file, exclusion_file, settings, digests):
+    '''Stores the settings and subject file hashes used for generating the R
+    table, together with hashes of the R table and exclusion counts
+    themselves, so that we notice if either was changed by something else.
+    '''
+    manifest = {
+        'version': _MANIFEST_VERSION,
+        'settings': settings,
+        'subjects': digests,
+        'output': file_digest(output_file),
+        'exclusions': file_digest(exclusion_file),
+    }
+    with open(manifest_path(output_file), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+###############################################################################
+## Finding out what changed
+###############################################################################
+
+def subj_digests(subj_files):
+    '''Given (subject_number, sentence_path, question_path) tuples returns a
+    dictionary of (subject_number : [sentence_hash, question_hash]) pairings.
+    Missing files have None as their hash.
+    '''
+    return dict((subj, [path and file_digest(path) for path in (f_path, q_path)])
+        for subj, f_path, q_path in subj_files)
+
+
+def changed_subjects(output_file, exclusion_file, settings, digests):
+    '''Compares the current settings and subject file hashes with the manifest
+    of the existing R table.
+    Returns the set of subject numbers that have to be processed again, or
+    None if the whole table has to be regenerated.
+    '''
+    manifest = read_manifest(output_file)
+    if manifest is None or manifest['settings'] != settings:
+        return None
+    for file_name, key in ((output_file, 'output'), (exclusion_file, 'exclusions')):
+        if not os.path.exists(file_name) or file_digest(file_name) != manifest[key]:
+            return None
+    old_digests = manifest['subjects']
+    return set(subj for subj, digest in digests.items()
+        if old_digests.get(subj) != digest)
+
+
+###############################################################################
+## Splicing tables
+###############################################################################
+
+def read_subj_lines(file_name, delimiter):
+    '''Reads a table file where the first column is the subject number.
+    Returns the header line and a dictionary of (subject_number : lines)
+    pairings. Lines are returned unchanged, including their line endings.
+    '''
+    lines_by_subj = {}
+    with open_table_file(file_name, newline='') as f:
+        header = f.readline()
+        for line in f:
+            subj = line.split(delimiter, 1)[0]
+            lines_by_subj.setdefault(subj, []).append(line)
+    return header, lines_by_subj
+
+
+def splice_table(old_file, new_file, output_file, subjects, changed, delimiter):
+    '''Combines the lines of the subjects in "changed" from new_file with the
+    lines of all other subjects from old_file, in the order of "subjects".
+    The result is written to output_file (which may be the same as old_file).
+    Any of the files may be compressed, see util.open_table_file().
+    '''
+    old_header, old_lines = read_subj_lines(old_file, delimiter)
+    new_header, new_lines = read_subj_lines(new_file, delimiter)
+    # keep the extension, so that compressed tables stay compressed
+    temp_file = '{0}.splicing{1}'.format(*split_extension(output_file))
+    with open_table_file(temp_file, 'w', newline='') as f:
+        f.write(new_header)
+        for subj in subjects:
+            source = new_lines if subj in changed else old_lines
+            f.writelines(source.get(subj, ()))
+    os.replace(temp_file, output_file)
@@ -8,6 +8,8 @@ in turn is read in by generate_R_table.py and turned into a .reg (region) file.
 '''
 # import everything from the utilities library
 from util import *
+# for keeping all the output files open at the same time
+from contextlib import ExitStack
 
 ###########################################################
 ## Main
@@ -17,9 +19,9 @@ def main():
 	'''Bringing it all together:
 	- ask user to provide the variables listed below
 	- create permissible item and condition number ranges
-	- read in the .script file as one big string
-	- extract the sentences from this string and write them to files
-	- extract questions from this string and write them to files
+	- go through the .script file once, one trial at a time, extracting
+	  the sentences and the questions
+	- write them to files as soon as they are found
 	'''
 	things_to_ask = [
 	'name of your experiment',
@@ -37,68 +39,117 @@ def main():
 	cond_range = generate_range(user_answers['number of the first condition'],
 								user_answers['total number of conditions'])
 
-	script_string = read_script_file(user_answers['name of your script file'])
-
-	rgx_template = 'trial E(\d+)I(\d+)D{0}.*?{1} =\s*{2}'
-	# rgx_template = 'trial E(\d+)I(\d+)D{0}.*?{1} =\s*{2}'
-
-	sent_rgx = re.compile(rgx_template.format(0, 'inline', '\|(.*?)\n'), re.DOTALL)
-	sentences = sent_rgx.findall(script_string)
-	write_out(user_answers['name of your experiment'],
-		'sentences',
-		item_range,
-		cond_range,
-		sentences)
-
-	question_rgx = re.compile(rgx_template.format(1, 'button', '(\w*)'), re.DOTALL)
-	questions = question_rgx.findall(script_string)
-	questions_with_codes = list(map(trigger_to_code, questions))
-	write_out(user_answers['name of your experiment'],
-		'questions',
-		item_range,
-		cond_range,
-		questions_with_codes)
+	with open_script_file(user_answers['name of your script file']) as script_file:
+		write_out(user_answers['name of your experiment'],
+			item_range,
+			cond_range,
+			script_items(script_file))
 
 
 def generate_range(start, total):
 	'''Provided with two numbers (as strings, because they are input by user),
 	returns a range of numbers from "start" to "end".
+	Checking if a number is in a range takes no longer for big ranges.
 	'''
 	start_int = int(start)
 	end_int = start_int + int(total)
-	return list(range(start_int, end_int))
+	return range(start_int, end_int)
 
 
 _READ_ERROR = ('Seems like you did not specify a valid .script file name.\n'
 	'Please either rename your file or provide a file with a .script extension.')
 
 
-def read_script_file(file_name):
+def open_script_file(file_name):
 	'''This function checks if the given file name has the .script extension
-	and if it does, opens the file and reads it in as one string.
+	and if it does, opens the file so that it can be read line by line.
 	If the file has a different extension, an exception is raised which alerts
 	the user and the program exits.
 	'''
 	if file_name.endswith('.script'):
-		with open(file_name) as f:
-			return f.read()
+		return open(file_name)
 	else:
 		raise Exception(_READ_ERROR)
 
 
-def write_out(exp_name, input_type, item_nums, cond_nums, data):
-	'''Writes all the data collected to two files:
-	One with all the data and one with only a subset thereof that fits in the
-	condition and item ranges specified by the user.
+# the pieces of a .script file we are interested in, in the order in which
+# they appear: the start of a trial ("trial E1I12D0", where D0 trials show a
+# sentence and D1 trials a question), the text of a sentence (after "|") and
+# the trigger that answers a question. Only one of the groups
+# (condition, item, D), (sentence,) or (trigger,) is filled for every match.
+_TOKEN_RGX = re.compile(r'trial E(\d+)I(\d+)D(\d+)'
+	r'|inline =[^\S\n]*\|(.*)\n'
+	r'|button =[^\S\n]*(\w*)')
+
+# how much of the .script file is read at a time
+_CHUNK_SIZE = 1 << 20
+
+
+def script_chunks(script_file, size=_CHUNK_SIZE):
+	'''Reads a .script file in pieces of about "size" characters that always
+	end at the end of a line.
+	'''
+	while True:
+		chunk = script_file.read(size)
+		if not chunk:
+			return
+		# finish the last line of the piece
+		yield chunk + script_file.readline()
+
+
+def script_items(script_file):
+	'''Goes through a .script file once, trial by trial, and yields the
+	sentences and questions in the order in which they appear:
+	('sentences', (condition, item, sentence)) for every D0 trial and
+	('questions', (condition, item, trigger, code)) for every D1 trial.
+	Only the first sentence or button of a trial is used, and a trial that
+	has none is skipped.
+	'''
+	# (condition, item, D) of the trial we are in, None once its sentence or
+	# question has been found
+	trial = None
+	for chunk in script_chunks(script_file):
+		for token in _TOKEN_RGX.finditer(chunk):
+			cond, item, display, sentence, trigger = token.groups()
+			if display is not None:
+				trial = (cond, item, display[0])
+			elif trial is None:
+				continue
+			elif sentence is not None and trial[2] == '0':
+				yield ('sentences', trial[:2] + (sentence,))
+				trial = None
+			elif trigger is not None and trial[2] == '1':
+				yield ('questions', trigger_to_code(trial[:2] + (trigger,)))
+				trial = None
+
+
+_INPUT_TYPES = ('sentences', 'questions')
+
+def write_out(exp_name, item_nums, cond_nums, items):
+	'''Writes the sentences and questions yielded by script_items() to files
+	as they come. For both of them, there is one file with all the data and
+	one with only a subset thereof that fits in the condition and item ranges
+	specified by the user.
 	'''
-	all_file = 'all_' + input_type + '.txt'
-	write_to_table(all_file, data, delimiter='\t')
-	print('Wrote {0} {1} to *{2}*'.format('all', input_type, all_file))
-
-	filtered_data = (d for d in data if check_cond_item(d, cond_nums, item_nums))
-	exp_file = exp_name + '_' + input_type + '.txt'
-	write_to_table(exp_file, filtered_data, delimiter='\t')
-	print('Wrote {0} {1} to *{2}*'.format(exp_name, input_type, exp_file))
+	file_names = [(input_type, 'all_' + input_type + '.txt',
+		exp_name + '_' + input_type + '.txt') for input_type in _INPUT_TYPES]
+	with ExitStack() as files:
+		# (writer for all the data, writer for the subset) for every input type
+		writers = {}
+		for input_type, all_file, exp_file in file_names:
+			writers[input_type] = tuple(
+				csv.writer(files.enter_context(open_table_file(name, 'w')),
+					delimiter='\t')
+				for name in (all_file, exp_file))
+		for input_type, entry in items:
+			all_writer, exp_writer = writers[input_type]
+			all_writer.writerow(entry)
+			if check_cond_item(entry, cond_nums, item_nums):
+				exp_writer.writerow(entry)
+
+	for input_type, all_file, exp_file in file_names:
+		print('Wrote {0} {1} to *{2}*'.format('all', input_type, all_file))
+		print('Wrote {0} {1} to *{2}*'.format(exp_name, input_type, exp_file))
 
 
 def check_cond_item(entry, cond_range, item_range):
@@ -1,5 +1,5 @@
-"""This script defines functions to add word information into the R table. It relies on functions from util.py from EyePy script collection and is supposed to be run automatically from generate_R_table.py. 
-If you have an older version of generate_R_table.py without the call to this script, you can run it manually as well.
+"""This script defines functions to add word information into the R table. It relies on functions from util.py from EyePy script collection. generate_R_table.py uses add_word_columns() to add the words while it writes the R table.
+If you have an R table made by an older version of generate_R_table.py without the words, you can run this script manually to add them.
 """
 
 # Created by Anton Malko in January 2016
@@ -11,9 +11,12 @@ If you have an older version of generate_R_table.py without the call to this scr
 # import regex lib
 import re
 # import some aux functions 
-from util import read_table, write_to_table, ask_user_questions, is_yes
+from util import (read_table, write_to_table, ask_user_questions, is_yes,
+    open_table_file)
 # import function to get non-adjacent elements from a list
 from operator import itemgetter
+# import function to put the header in front of the rows
+from itertools import chain
 
 
 ###########################################################
@@ -29,27 +32,34 @@ def make_word_dict(del_file):
     The values are taken form .del file with region mark-up
     '''
     word_dict = {}
-    with open(del_file) as del_file:
+    with open_table_file(del_file) as del_file:
         # split into condition number, item number, words in the sentence
         split_lines = [line.strip().split(' ') for line in del_file]
     for line in split_lines:
         # extract condition and item number
-        item_info = [str(line[0]), str(line[1])]
-        # remove newlines symbols in the beginning of the line
-        # or after a region boundary
-        line = [re.sub('(^|/)\\\\n', '\\1', s) for s in line]
-        # if the newlines symbols are in the middle of the line,
-        # replace them with whitespaces
-        line = [re.sub('\\\\n', ' ', s) for s in line]
-        # split by /, which denote region boundaries
-        item_sents = ' '.join(line[2:]).split('/')
-        # item_sents = [s.replace('\n','') for s in item_sents]
-        res = dict((tuple(item_info + [str(count)]), word) for count, word in enumerate(item_sents))
+        item_info = (str(line[0]), str(line[1]))
+        # split the rest of the line into the words of every region
+        item_sents = region_words(' '.join(line[2:]))
+        res = dict((item_info + (str(count),), word) for count, word in enumerate(item_sents))
         word_dict.update(res)
 
     return word_dict
 
 
+# A "\\n" symbol at the beginning of a word or right after a region boundary
+# is removed, any other "\\n" (in the middle of a word) becomes a whitespace.
+# Only the latter ones are captured by the group.
+_NEWLINE_RGX = re.compile(r'(?:^|(?<=[ /]))\\n|(\\n)')
+
+def region_words(text):
+    '''Given the text of an item from a .del file (everything after the
+    condition and item number) returns a list with the words of every region.
+    '''
+    no_newlines = _NEWLINE_RGX.sub(lambda match: ' ' if match.group(1) else '', text)
+    # split by /, which denote region boundaries
+    return no_newlines.split('/')
+
+
 ###########################################################
 ## The main function
 ###########################################################
@@ -68,8 +78,7 @@ def add_words(del_file, table_file, output_file):
     print("Adding word information...")
     word_dict = make_word_dict(del_file)
     tabl = read_table(table_file)
-    tabl = [list(x) for x in tabl]
-    tabl[0] = [
+    header = [
         'subj',
         'order',
         'cond',
@@ -83,16 +92,29 @@ def add_words(del_file, table_file, output_file):
         'Yend',
         'fixationtype',
         'value',
-        'words',
-        'wordsLen'
-    ]
+    ] + WORD_COLUMNS
 
-    for i in range(1, len(tabl)):
-        word_key = itemgetter(2, 3, 6)(tabl[i])
-        # write both word and its length
-        tabl[i].extend([word_dict[word_key], len(word_dict[word_key])])
+    rows = add_word_columns(tabl[1:], word_dict)
+    write_to_table(output_file, chain([header], rows), delimiter='\t')
 
-    write_to_table(output_file, tabl, delimiter='\t')
+
+# names of the columns added by add_words() and add_word_columns()
+WORD_COLUMNS = ['words', 'wordsLen']
+
+
+def add_word_columns(rows, word_dict, key_columns=(2, 3, 6)):
+    '''A generator that adds the words of the region and their length to every
+    row of an R table as it goes by, so that the words can be added while the
+    table is being written, instead of reading it back in afterwards.
+    key_columns are the positions of the condition, item and region columns
+    in the rows.
+    '''
+    get_key = itemgetter(*key_columns)
+    for row in rows:
+        # the dictionary keys are strings, the rows may contain numbers
+        words = word_dict[tuple(map(str, get_key(row)))]
+        # write both word and its length
+        yield tuple(row) + (words, len(words))
 
 
 ###########################################################
@@ -0,0 +1,154 @@
+'''Runs sort_da1.py and generate_R_table.py in one go: the unsorted DA1 files
+are split into sentences, questions and rejected trials in memory and passed
+straight to the R table generator, without writing the sorted DA1 files and
+reading them back in.
+Writing the sorted folders is still possible with the --write-sorted option,
+e.g. if you want to split the data by experiment with sort_da1.py later.
+'''
+
+# Structure:
+# 1. Imports
+# 2. Main function
+# 3. Command line options
+
+###########################################################
+## Imports
+###########################################################
+
+import argparse
+from util import ask_user_questions, FSYNC_POLICIES, WRITE_THREADS
+from sort_da1 import sort_da1_data, write_da1
+from generate_R_table import (load_regions, compile_region_table,
+    read_answer_key, tables_from_sorted_da1, verify_cutoff_values,
+    cutoff_pair, measure_list, get_measure_engine, MEASURE_ENGINES,
+    MEASURE_NAMES, process_subj,
+    process_subj_parallel, write_R_table, exclusion_file_name)
+
+
+###########################################################
+## Main function
+###########################################################
+
+def main():
+    arguments = parse_arguments()
+    measure_engine = get_measure_engine(arguments.engine,
+        measures=arguments.measures)
+
+    our_questions = [
+        'folder with unsorted DA1 files',
+        'name of your study',
+        'REG (or DEL) filename',
+        'Question key filename',
+        'Output filename',
+    ]
+    file_names = ask_user_questions(our_questions)
+    if arguments.cutoffs:
+        cutoffs = arguments.cutoffs
+    else:
+        cutoffs = verify_cutoff_values(40, 1000)
+
+    # (subject#, sentences, questions, rejects) for every DA1 file
+    sorted_da1s = sort_da1_data(file_names['folder with unsorted DA1 files'])
+    if arguments.write_sorted:
+        failures = write_da1(file_names['name of your study'], sorted_da1s,
+            threads=arguments.write_threads, fsync=arguments.fsync)
+        if failures:
+            print('{0} sorted DA1 files could not be written, see above.'.format(
+                len(failures)))
+    # (subject#, fixation_table, question_table) for every subject
+    tables_by_subj = tables_from_sorted_da1(sorted_da1s, compact=arguments.compact)
+    # the lines are not needed anymore once they are turned into tables
+    del sorted_da1s
+
+    table_of_regions, word_dict = load_regions(file_names['REG (or DEL) filename'])
+    table_of_regions = compile_region_table(table_of_regions)
+    answer_key = read_answer_key(file_names['Question key filename'])
+
+    if arguments.workers > 1:
+        all_subj_data = process_subj_parallel(tables_by_subj,
+            table_of_regions, answer_key, cutoffs, engine=measure_engine,
+            workers=arguments.workers)
+    else:
+        all_subj_data = process_subj(tables_by_subj, table_of_regions,
+            answer_key, cutoffs, engine=measure_engine)
+    # the rows of a subject are written as soon as it is processed, so only
+    # one subject's rows have to be kept in memory
+    write_R_table(counted_subj_data(all_subj_data),
+        file_names['Output filename'],
+        exclusion_file_name(file_names['Output filename']), word_dict,
+        wide=arguments.wide, codes=arguments.codes,
+        measures=arguments.measures)
+
+
+def counted_subj_data(subj_data):
+    '''Passes on the (rows, exclusions) pairs of subj_data unchanged and
+    prints how many subjects there were once all of them have been passed on.
+    '''
+    subj_count = 0
+    for subj_count, subj_pair in enumerate(subj_data, 1):
+        yield subj_pair
+    print('Done processing. Created data for {0} subjects.'.format(subj_count))
+
+
+###########################################################
+## Command line options
+###########################################################
+
+def parse_arguments(argv=None):
+    '''Defines and reads the command line options of this script.
+    None of them are required, all file names are asked for interactively.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--write-sorted',
+        action='store_true',
+        help='also write the sorted DA1 files to the STUDY-sorted folder, '
+            'just like sort_da1.py does')
+    parser.add_argument('--write-threads',
+        type=int,
+        default=WRITE_THREADS,
+        metavar='N',
+        help='write N sorted DA1 files at the same time with --write-sorted '
+            '(default: {0})'.format(WRITE_THREADS))
+    parser.add_argument('--fsync',
+        choices=FSYNC_POLICIES,
+        default='none',
+        help='with --write-sorted, wait until the sorted DA1 files ("files") '
+            'or also their folders ("folders") are on disk (default: none)')
+    parser.add_argument('--cutoffs',
+        type=cutoff_pair,
+        metavar='LOW:HIGH',
+        help='use these cutoffs instead of asking for them')
+    parser.add_argument('--engine',
+        choices=sorted(MEASURE_ENGINES),
+        default='python',
+        help='how to compute the measures, see generate_R_table.py --help')
+    parser.add_argument('--workers',
+        type=int,
+        default=1,
+        metavar='N',
+        help='process N subjects at the same time in separate processes')
+    parser.add_argument('--compact',
+        action='store_true',
+        help='store fixations in compact arrays instead of Python tuples')
+    parser.add_argument('--wide',
+        action='store_true',
+        help='write one row per region of every trial with one column per '
+            'measure, see generate_R_table.py --help')
+    parser.add_argument('--codes',
+        action='store_true',
+        help='write integer codes instead of text, see generate_R_table.py --help')
+    parser.add_argument('--measures',
+        type=measure_list,
+        default=MEASURE_NAMES,
+        metavar='NAME,...',
+        help='only write these measures, e.g. fp,rp,tt')
+    arguments = parser.parse_args(argv)
+    if arguments.workers < 1:
+        parser.error('--workers has to be at least 1')
+    if arguments.write_threads < 1:
+        parser.error('--write-threads has to be at least 1')
+    return arguments
+
+
+if __name__ == '__main__':
+    main()
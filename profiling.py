@@ -0,0 +1,329 @@
+'''Optional profiling of EyePy runs. When it is turned on (with the --profile
+option of generate_R_table.py and sort_da1.py), the wall time, CPU time and
+peak memory of every stage of the processing are recorded, together with
+counters such as the number of trials and fixations, and written to a JSON
+report at the end of the run.
+When it is off, stage() and count() do nothing, so the scripts can call
+them everywhere without slowing down normal runs.
+'''
+
+# Structure:
+# 1. Imports
+# 2. Turning profiling on and recording stages
+# 3. The profiler
+# 4. Reports
+
+###############################################################################
+## Imports
+###############################################################################
+
+import os, sys, json, time
+from contextlib import nullcontext
+# peak memory is only available on Unix-like systems
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+###############################################################################
+## Turning profiling on and recording stages
+###############################################################################
+
+# the profiler of this process, None if profiling is off
+_profiler = None
+
+# reused for every stage while profiling is off
+_NO_STAGE = nullcontext()
+
+
+def enable():
+    '''Turns profiling on for this process (dropping anything recorded before)
+    and returns the profiler.
+    '''
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def enabled():
+    '''Returns True if profiling is on.'''
+    return _profiler is not None
+
+
+def stage(name):
+    '''Returns a context manager that records the time spent inside it as part
+    of the stage "name". A stage can be entered many times (e.g. once per
+    trial); the times add up.
+    '''
+    if _profiler is None:
+        return _NO_STAGE
+    return _profiler.stage(name)
+
+
+def count(name, amount=1):
+    '''Adds amount to the counter "name".'''
+    if _profiler is not None:
+        _profiler.count(name, amount)
+
+
+def timed_iter(name, iterable):
+    '''Returns iterable unchanged if profiling is off. Otherwise returns an
+    iterator over it that records the time spent getting every item as part
+    of the stage "name". This is for stages that happen one item at a time,
+    interleaved with others (e.g. adding words to the rows while they are
+    written). Only wall time is recorded for such stages, because measuring
+    CPU time for every item would slow the run down too much.
+    '''
+    if _profiler is None:
+        return iterable
+    return _profiler.timed_iter(name, iterable)
+
+
+def count_calls(module, function_name, counter_name):
+    '''If profiling is on, replaces a function of a module with a version that
+    counts how often it is called.
+    '''
+    if _profiler is None:
+        return
+    function = getattr(module, function_name)
+    # forked worker processes inherit the counting version
+    if getattr(function, 'counted_as', None) == counter_name:
+        return
+    def counted(*args, **kwargs):
+        count(counter_name)
+        return function(*args, **kwargs)
+    counted.counted_as = counter_name
+    setattr(module, function_name, counted)
+
+
+def report():
+    '''Returns everything recorded so far as a dictionary (see
+    Profiler.report()), or None if profiling is off.
+    '''
+    if _profiler is None:
+        return None
+    return _profiler.report()
+
+
+def take():
+    '''Returns the stages and counters recorded so far and starts over,
+    or None if profiling is off. Used by worker processes to send what they
+    recorded back to the main process, see merge().
+    '''
+    global _profiler
+    if _profiler is None:
+        return None
+    recorded = (_profiler.stages, _profiler.counters)
+    _profiler = Profiler()
+    return recorded
+
+
+def merge(recorded):
+    '''Adds the stages and counters returned by take() (in another process) to
+    the ones of this process.
+    '''
+    if _profiler is not None and recorded is not None:
+        _profiler.merge(*recorded)
+
+
+###############################################################################
+## The profiler
+###############################################################################
+
+def cpu_time():
+    '''Returns the CPU time used by this process so far, in seconds.'''
+    return time.process_time()
+
+
+def children_cpu_time():
+    '''Returns the CPU time used so far by the finished child processes of
+    this process (e.g. the workers of a process pool), in seconds. The
+    figure only grows, so stages record how much it grew while they ran.
+    '''
+    if resource is None:
+        times = os.times()
+        return times.children_user + times.children_system
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def peak_memory(who='self'):
+    '''Returns the peak memory (resident set size) in megabytes of this
+    process ("self") or the largest of its finished child processes
+    ("children"), or None if this cannot be found out.
+    '''
+    if resource is None:
+        return None
+    which = resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN
+    peak = resource.getrusage(which).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == 'darwin':
+        return round(peak / 2 ** 20, 1)
+    return round(peak / 2 ** 10, 1)
+
+
+class Profiler(object):
+    '''Collects the times of stages and counters for one process.
+    For every stage, "wall" and "cpu" are the total times spent in it, and
+    "self_wall" and "self_cpu" the same times minus those of stages that
+    happened inside it (e.g. measures that are computed while the R table is
+    being written). "cpu" only counts this process (and, once merged, the
+    stages recorded in worker processes); "children_cpu" is the CPU time of
+    child processes that finished during the stage. "peak_memory_mb" is the
+    peak memory of the process at the end of the stage.
+    '''
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        # [wall, cpu] of the stages nested in every stage that is running
+        self._nested = []
+        self.start_wall = time.perf_counter()
+        self.start_cpu = cpu_time()
+        self.start_children_cpu = children_cpu_time()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def _record(self, name):
+        '''Returns the record of a stage, creating it if needed.'''
+        if name not in self.stages:
+            self.stages[name] = {'calls': 0, 'wall': 0.0, 'self_wall': 0.0,
+                'cpu': 0.0, 'self_cpu': 0.0, 'children_cpu': 0.0,
+                'peak_memory_mb': None}
+        return self.stages[name]
+
+    def _finish(self, name, wall, cpu, nested, children_cpu=None):
+        '''Adds the times of one run of a stage to its record and to the
+        nested times of the stage it happened in.
+        '''
+        if self._nested:
+            parent = self._nested[-1]
+            parent[0] += wall
+            parent[1] += cpu or 0.0
+        record = self._record(name)
+        record['calls'] += 1
+        record['wall'] += wall
+        record['self_wall'] += wall - nested[0]
+        if cpu is None:
+            record['cpu'] = record['self_cpu'] = None
+        else:
+            record['cpu'] += cpu
+            record['self_cpu'] += cpu - nested[1]
+        if children_cpu is None:
+            record['children_cpu'] = None
+        elif record['children_cpu'] is not None:
+            record['children_cpu'] += children_cpu
+
+    def timed_iter(self, name, iterable):
+        iterator = iter(iterable)
+        clock = time.perf_counter
+        while True:
+            nested = [0.0, 0.0]
+            self._nested.append(nested)
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                wall = clock() - start
+                self._nested.pop()
+                self._finish(name, wall, None, nested)
+            yield item
+
+    def merge(self, stages, counters):
+        for name, other in stages.items():
+            record = self._record(name)
+            for key in ('calls', 'wall', 'self_wall', 'cpu', 'self_cpu',
+                        'children_cpu'):
+                if record[key] is None or other[key] is None:
+                    record[key] = None
+                else:
+                    record[key] += other[key]
+            if other['peak_memory_mb'] is not None:
+                record['peak_memory_mb'] = max(record['peak_memory_mb'] or 0,
+                    other['peak_memory_mb'])
+        for name, amount in counters.items():
+            self.count(name, amount)
+
+    def report(self):
+        '''Returns everything recorded so far as a dictionary.'''
+        return {
+            'total': {
+                'wall': time.perf_counter() - self.start_wall,
+                'cpu': cpu_time() - self.start_cpu,
+                'children_cpu': children_cpu_time() - self.start_children_cpu,
+                'peak_memory_mb': peak_memory('self'),
+                'children_peak_memory_mb': peak_memory('children'),
+            },
+            'stages': self.stages,
+            'counters': self.counters,
+        }
+
+
+class _Stage(object):
+    '''Context manager returned by Profiler.stage().'''
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.nested = [0.0, 0.0]
+        self.profiler._nested.append(self.nested)
+        self.start_wall = time.perf_counter()
+        self.start_cpu = cpu_time()
+        self.start_children_cpu = children_cpu_time()
+
+    def __exit__(self, *exception):
+        wall = time.perf_counter() - self.start_wall
+        cpu = cpu_time() - self.start_cpu
+        children_cpu = children_cpu_time() - self.start_children_cpu
+        self.profiler._nested.pop()
+        self.profiler._finish(self.name, wall, cpu, self.nested, children_cpu)
+        self.profiler._record(self.name)['peak_memory_mb'] = peak_memory('self')
+
+
+###############################################################################
+## Reports
+###############################################################################
+
+def rate(amount, seconds):
+    '''Returns amount per second, or None if no time was spent.'''
+    if not seconds:
+        return None
+    return amount / seconds
+
+
+def write_report(file_name, rates=None):
+    '''Writes the JSON report with everything recorded in this process (and
+    merged from worker processes), together with the given rates (a
+    dictionary of name: value pairs), and prints a summary of the stages.
+    '''
+    results = report()
+    results['command'] = sys.argv
+    results['rates'] = rates or {}
+    with open(file_name, 'w') as report_file:
+        json.dump(results, report_file, indent=1, sort_keys=True)
+
+    print('\n{0:<22}{1:>8}{2:>11}{3:>11}{4:>11}{5:>15}{6:>10}'.format(
+        'stage', 'calls', 'wall (s)', 'self (s)', 'cpu (s)', 'child cpu (s)',
+        'mem (MB)'))
+    for name, record in results['stages'].items():
+        cpu, children_cpu = ('-' if value is None else '{0:.3f}'.format(value)
+            for value in (record['cpu'], record.get('children_cpu')))
+        memory = record['peak_memory_mb']
+        print('{0:<22}{1:>8}{2:>11.3f}{3:>11.3f}{4:>11}{5:>15}{6:>10}'.format(
+            name, record['calls'], record['wall'], record['self_wall'], cpu,
+            children_cpu, '-' if memory is None else memory))
+    for name, amount in sorted(results['counters'].items()):
+        print('{0}: {1}'.format(name, amount))
+    for name, value in sorted(results['rates'].items()):
+        if value is not None:
+            print('{0}: {1:.1f}'.format(name, value))
+    print('Saved the profile to "{0}"'.format(file_name))
@@ -9,7 +9,7 @@ DA1s.
 # Structure:
 # 1. Main functtion
 # 2. Dealing with unsorted DA1 files
-# 3. Loading sorted DA1s
+# 3. Sorted DA1 folders
 # 4. Selecting items for just one experiment
 # 5. Writing DA1s to folders
 
@@ -18,6 +18,12 @@ DA1s.
 from itertools import repeat
 # import functionality from utility module
 from util import *
+# command line options
+import argparse
+# for splitting several files at the same time
+from concurrent.futures import ProcessPoolExecutor
+# for the --profile option
+import profiling
 
 
 ###############################################################################
@@ -33,6 +39,9 @@ _START_EXP_SPLIT = 'Do you want to split the data by experiment?'
 _MORE_EXP_SPLIT = 'Do you want to split the data by more experiments?'
 
 def main():
+    arguments = parse_arguments()
+    if arguments.profile is not None:
+        profiling.enable()
     # ask user if they want to split da1s
     split_study = input(_SPLIT_WHOLE_STUDY)
     # if they do, ask them for folder with unsorted DA1s and the name of study
@@ -42,40 +51,123 @@ def main():
         'name of your study',
         ]
         [da1_folder, study_name] = ask_user_questions(questions, return_list=True)
-        sorted_da1s = sort_da1_data(da1_folder)
-        write_da1(study_name, sorted_da1s)
         study_root = study_name + '-sorted'
-    # if DA1 already sorted, ask for location of sorted files and load them
+    # if DA1 already sorted, ask for location of sorted files
     else:
+        da1_folder = None
         sorted_folder = input('Enter the sorted files folder:\n')
-        sorted_da1s = load_sorted_da1(sorted_folder)
         study_root = sorted_folder
 
     #===========================================================================
     ## Extracting items for individual experiments
-    experiment_meta_qs = [
+    # all the experiments are known before any file is read, so that every
+    # line can be sent to its experiments in the same pass
+    if arguments.experiments is not None:
+        experiments = arguments.experiments
+    else:
+        experiments = ask_experiments()
+    experiment_folders = create_experiment_folders(experiments, study_root)
+    profiling.count('experiments', len(experiments))
+
+    if da1_folder is not None:
+        # every line goes straight from the DA1 file to the sorted file and
+        # the files of its experiments
+        split_da1_files(da1_folder, study_name, workers=arguments.workers,
+            extension=arguments.extension, experiment_folders=experiment_folders)
+    elif experiments:
+        print('Subsetting DA1 data.')
+        with profiling.stage('experiment routing'):
+            route_sorted_da1(sorted_folder, experiment_folders,
+                extension=arguments.extension)
+    if experiments:
+        print('Done writing data for {0} experiments!'.format(len(experiments)))
+
+    if profiling.enabled():
+        profiling.write_report(arguments.profile or study_root + '.profile.json')
+    print('Ok, bye!')
+
+
+_EXPERIMENT_META_QS = [
     'name of your experiment',
     'first condition for this experiment',
     'total number of conditions for this experiment'
     ]
 
+def ask_experiments():
+    '''Asks the user whether to split the data by experiment and about every
+    experiment, until they say there are no more.
+    Returns a list of (experiment_name, conditions) pairs, see
+    condition_filter().
+    '''
+    experiments = []
     experiment_split_decision = input(_START_EXP_SPLIT)
     splitting_by_experiment = is_yes(experiment_split_decision)
-
     while splitting_by_experiment:
         # ask some questions about the experiment
-        exp_meta = ask_user_questions(experiment_meta_qs, return_list=True)
+        exp_meta = ask_user_questions(_EXPERIMENT_META_QS, return_list=True)
         # unpack users answers into variables
         [exp_name, first_cond, cond_total] = exp_meta
-        exp_filter = condition_filter(first_cond, cond_total)
-        print('Subsetting DA1 data.')
-        exp_data = [get_exp_items(item, exp_filter) for item in sorted_da1s]
-        write_da1(exp_name, exp_data, nest_under=study_root)
-        print('Done writing data for this experiment!')
+        experiments.append((exp_name, condition_filter(first_cond, cond_total)))
         continue_decision = input(_MORE_EXP_SPLIT)
         splitting_by_experiment = is_yes(continue_decision)
+    return experiments
 
-    print('Ok, bye!')
+
+def parse_arguments(argv=None):
+    '''Defines and reads the command line options of this script. None of
+    them are required, everything else is still asked for interactively.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        metavar='N',
+        help='split N DA1 files at the same time in separate processes '
+            '(default: number of CPUs)')
+    parser.add_argument('--compress',
+        choices=COMPRESSION_FORMATS,
+        help='compress the sorted DA1 files in this format '
+            '(e.g. "1-study-s.da1.gz"); generate_R_table.py reads them as they are')
+    parser.add_argument('--profile',
+        nargs='?',
+        const='',
+        metavar='FILE',
+        help='report the time and memory spent in every stage and counts of '
+            'files and lines in FILE (by default "STUDY-sorted.profile.json")')
+    parser.add_argument('--experiments',
+        nargs='*',
+        type=experiment_conditions,
+        metavar='NAME:FIRST:TOTAL',
+        help='split the data into these experiments without asking, e.g. '
+            '"expA:1:4 expB:5:4" for conditions 1-4 and 5-8; with no '
+            'experiments after it, the data is not split by experiment')
+    arguments = parser.parse_args(argv)
+    if arguments.workers < 1:
+        parser.error('--workers has to be at least 1')
+    arguments.extension = da1_extension(arguments.compress)
+    return arguments
+
+
+def experiment_conditions(text):
+    '''Converts a "NAME:FIRST:TOTAL" string from the command line to an
+    (experiment_name, conditions) pair, see condition_filter().
+    '''
+    try:
+        exp_name, first_cond, cond_total = text.rsplit(':', 2)
+        return (exp_name, condition_filter(first_cond, cond_total))
+    except ValueError:
+        raise argparse.ArgumentTypeError('experiments should look like '
+            'expA:1:4 (name, first condition, number of conditions), '
+            'not "{0}"'.format(text))
+
+
+def da1_extension(compression=None):
+    '''Returns the extension of the sorted DA1 files, which includes the
+    compression format if one is given (e.g. "gz" -> ".da1.gz").
+    '''
+    if compression:
+        return '.da1.' + compression
+    return '.da1'
 
 
 ###############################################################################
@@ -89,12 +181,28 @@ def sort_da1_data(data_dir):
     question and rejected trials.
     '''
     print('Sorting DA1 files from {0}'.format(data_dir))
-    # generate the paths to files using function from util module
-    file_list = gen_file_paths(data_dir, filter_func=is_DA1_file)
+    # one file per subject, see subject_da1_files()
+    file_list = subject_da1_files(data_dir)
     # we then run parse_da1_file function on every member of file_list
     return list(map(parse_da1_file, file_list))
 
 
+def subject_da1_files(data_dir):
+    '''Returns the paths of the DA1 files in data_dir, one per subject.
+    If several files have the same subject number, the last one listed is
+    used and the others are reported and skipped, so that sort_da1_data()
+    and split_da1_files() never mix the trials of different files.
+    '''
+    subj_files = {}
+    for file_path in gen_file_paths(data_dir, filter_func=is_DA1_file):
+        subj_number = get_subj_num(file_path)
+        if subj_number in subj_files:
+            print('Several DA1 files for subject {0}, skipping {1}'.format(
+                subj_number, subj_files[subj_number]))
+        subj_files[subj_number] = file_path
+    return list(subj_files.values())
+
+
 def parse_da1_file(file_name):
     '''Given a file name extracts the subject number from it as well as all the
     sentence, question and rejected items for this subject.
@@ -103,19 +211,141 @@ def parse_da1_file(file_name):
     '''
     # using function imported from util module
     subj_number = get_subj_num(file_name)
-    with open(file_name) as da1file:
-        # we start by filtering out all empty lines
-        non_empty = [line.strip().split() for line in da1file if line]
-        # we then collect the sentence, question and rejected lists
-        sentences = [line for line in non_empty if classify_line(line) is 's']
-        questions = [line for line in non_empty if classify_line(line) is 'q']
-        rejects = [line for line in non_empty if classify_line(line) is 'reject']
-    return (subj_number, sentences, questions, rejects)
+    sorted_lines = {'s': [], 'q': [], 'reject': []}
+    # the file is memory-mapped and every line decoded once, see
+    # util.iter_byte_lines()
+    for line in iter_byte_lines(file_name):
+        fields = line.decode().split()
+        # skip empty lines, classify every other line exactly once
+        if fields:
+            sorted_lines[classify_line(fields)].append(fields)
+    return (subj_number, sorted_lines['s'], sorted_lines['q'],
+        sorted_lines['reject'])
+
+
+# suffixes of the sorted folders and files for every type of trial
+_TRIAL_TYPE_SUFFIXES = {
+    's': '-s',
+    'q': '-q',
+    'reject': '-reject',
+}
+
+# names of the trial types in the --profile report
+_TRIAL_TYPE_NAMES = {
+    's': 'sentence',
+    'q': 'question',
+    'reject': 'rejected',
+}
+
+def split_da1_files(data_dir, study_name, workers=1, extension='.da1',
+                    experiment_folders=None):
+    '''Streaming alternative to sort_da1_data() followed by write_da1().
+    Reads every DA1 file in data_dir line by line and writes every line
+    straight to the sentence, question or rejected trials file of its
+    subject in the study_name-sorted folder, without keeping any of them
+    in memory. The lines are never decoded: they are split and written back
+    as bytes. Several files are split at the same time if workers > 1.
+    The sorted files get the given extension, see da1_extension().
+    If experiment_folders (see create_experiment_folders()) are given, every
+    line is also written to the folders of the experiments its condition
+    belongs to, in the same pass.
+    '''
+    print('Sorting DA1 files from {0}'.format(data_dir))
+    root_path = study_name + '-sorted'
+    print('Writing sorted DA1s to {0}'.format(root_path))
+    create_sorted_folders(root_path, study_name)
+    with profiling.stage('file discovery'):
+        file_list = subject_da1_files(data_dir)
+    profiling.count('DA1 files', len(file_list))
+    with profiling.stage('splitting'):
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # list() makes sure we see errors from the worker processes
+                line_counts = list(executor.map(split_da1_file, file_list,
+                    repeat(root_path), repeat(study_name), repeat(extension),
+                    repeat(experiment_folders)))
+        else:
+            line_counts = [split_da1_file(file_path, root_path, study_name,
+                    extension, experiment_folders)
+                for file_path in file_list]
+    for counts in line_counts:
+        for trial_type, lines in counts.items():
+            profiling.count(_TRIAL_TYPE_NAMES[trial_type] + ' lines', lines)
+
+
+def split_da1_file(file_name, root_path, study_name, extension='.da1',
+                   experiment_folders=None):
+    '''Splits one DA1 file for split_da1_files(). Output files are only
+    created for trial types that the subject actually has, just like
+    create_folder() does.
+    Returns a dictionary with the number of lines of every trial type.
+    '''
+    subj_number = get_subj_num(file_name)
+    study_folder = ((root_path, study_name),)
+    # output files (opened as bytes) for every (folder, trial type),
+    # opened when needed
+    outputs = {}
+    line_counts = dict.fromkeys(_TRIAL_TYPE_SUFFIXES, 0)
+    try:
+        for line in iter_byte_lines(file_name):
+            fields = line.split()
+            if not fields:
+                continue
+            trial_type = classify_line(fields)
+            folders = study_folder
+            if experiment_folders:
+                folders += experiment_folders.get(fields[1], ())
+            write_sorted_line(outputs, folders, trial_type, subj_number,
+                extension, join_da1_fields(fields, line))
+            line_counts[trial_type] += 1
+    finally:
+        for output in outputs.values():
+            output.close()
+    return line_counts
+
+
+def write_sorted_line(outputs, folders, trial_type, subj_number, extension,
+                      line):
+    '''Writes a line to the file of the subject for the trial type in every
+    one of the (root_path, study_or_experiment_name) folders. The files are
+    named like those of create_folder(), and opened as they are needed and
+    kept in the outputs dictionary.
+    '''
+    suffix = _TRIAL_TYPE_SUFFIXES[trial_type]
+    for folder in folders:
+        if (folder, trial_type) not in outputs:
+            root_path, name = folder
+            subj_file_name = subj_number + '-' + name + suffix + extension
+            subj_file_path = os.path.join(root_path, name + suffix, subj_file_name)
+            outputs[folder, trial_type] = open_table_file(subj_file_path, 'wb')
+        outputs[folder, trial_type].write(line)
+
+
+def create_sorted_folders(root_path, name):
+    '''Creates the folders for sentence, question and rejected trials of
+    a study or an experiment inside root_path.
+    '''
+    for suffix in _TRIAL_TYPE_SUFFIXES.values():
+        os.makedirs(os.path.join(root_path, name + suffix), exist_ok=True)
+
+
+def join_da1_fields(fields, line):
+    '''Given the fields of a DA1 line (as bytes) and the line itself, returns
+    the line that csv.writer(delimiter=' ') writes for these fields, which is
+    how sorted DA1 files have always been written.
+    '''
+    # fields never contain spaces or line breaks, so csv.writer only
+    # quotes those with quote characters in them
+    if b'"' in line:
+        fields = [b'"' + field.replace(b'"', b'""') + b'"' if b'"' in field
+            else field for field in fields]
+    return b' '.join(fields) + b'\r\n'
 
 
 def classify_line(line):
-    '''Given a line (as a list of strings), determines what type of trial
-    this line is: whether it is a question, a sentence or a rejected trial.
+    '''Given a line (as a list of strings or bytes), determines what type of
+    trial this line is: whether it is a question, a sentence or a rejected
+    trial.
     '''
     trial_types = {
     '2' : 's',
@@ -123,41 +353,17 @@ def classify_line(line):
     '7' : 'q',
     }
     item_type = line[4]
+    if isinstance(item_type, bytes):
+        item_type = item_type.decode()
     if item_type in trial_types:
         return trial_types[item_type]
     return 'reject'
 
 
 ###############################################################################
-## loading sorted DA1s
+## Sorted DA1 folders
 ###############################################################################
 
-def load_sorted_da1(sorted_dir_path):
-    '''Given path to a folder with the sorted DA1 files, reads in said files
-    and returns the same data structure as sort_da1_data, namely a list of
-    tuples where subject numbers are bound to lists of sentence, question, rejected
-    items.
-    '''
-    print('Loading sorted DA1s from {0}'.format(sorted_dir_path))
-    suffixes = (
-        ('-s', 1),
-        ('-q', 2),
-        ('-reject', 3))
-    study_name = get_study_name(sorted_dir_path)
-    sorted_da1 = []
-    # for every type of DA1 files (sentences, questions, rejections)
-    for suffix, index in suffixes:
-        # create path to folder containing these files
-        type_root = os.path.join(sorted_dir_path, study_name + suffix)
-        # use util.py's gen_file_paths() to create a list of files
-        # only include da1 files in this list
-        subj_files = gen_file_paths(type_root, filter_func=is_DA1_file)
-        # load all files in list and add them to list of sorted DA1 files
-        sorted_da1 += [load_da1_file(f, index) for f in subj_files]
-    print('Loaded successfully!')
-    return sorted_da1
-
-
 def get_study_name(dir_path):
     '''Given a folder name extracts the study name from it, assuming the following
     folder name format:
@@ -169,27 +375,6 @@ def get_study_name(dir_path):
     return os.path.basename(normed_dir_path).split('-')[0]
 
 
-def load_da1_file(file_path, index):
-    '''This function loads only sentence or question or rejection items
-    for a subject from a da1 file and returns them in the same format as if we
-    read in an unsorted da1 file:
-    (subject#, sentences, questions, rejects)
-    However, in this case two of the lists will be empty, as we are loading a
-    sorted file.
-    The "index" argument deterimines which one of the three lists gets populated
-    with the items extracted from the file.
-    '''
-    # use function from util to get subject number
-    subj_number = get_subj_num(file_path)
-    # initialize a frame for a subject with their number and 3 empty lists
-    subj_frame = [subj_number, [], [], []]
-    with open(file_path) as da1file:
-        # set the relevant list to lines of DA1 file
-        subj_frame[index] = [line.strip().split() for line in da1file]
-    # convert the whole frame to tuple (for speed) and return
-    return tuple(subj_frame)
-
-
 ###############################################################################
 ## Selecting items for only one experiment
 ###############################################################################
@@ -210,32 +395,68 @@ def condition_filter(start, total):
     return tuple(map(str, range(start_int, start_int + total_int)))
 
 
-def get_exp_items(item, cond_range):
-    '''Given a (subject#, sents, questions, rejects) tuple as well as a range of
-    conditions selects only those sentence/question/reject items whose second element
-    (the condition code) is found in the range of permissible conditions.
+def create_experiment_folders(experiments, study_root):
+    '''Given (experiment_name, conditions) pairs creates the sorted folders of
+    every experiment inside study_root, just like write_da1() does, and
+    returns a dictionary from every condition (as bytes, the way
+    split_da1_file() reads it) to the (root_path, experiment_name) folders
+    of all the experiments that include it. If the conditions of several
+    experiments overlap, their lines go to all of them.
+    '''
+    experiment_folders = {}
+    for exp_name, cond_range in experiments:
+        folder = (os.path.join(study_root, exp_name + '-sorted'), exp_name)
+        print('Writing sorted DA1s to {0}'.format(folder[0]))
+        create_sorted_folders(*folder)
+        for condition in cond_range:
+            folders = experiment_folders.setdefault(condition.encode(), ())
+            if folder not in folders:
+                experiment_folders[condition.encode()] = folders + (folder,)
+    return experiment_folders
+
+
+def route_sorted_da1(sorted_dir_path, experiment_folders, extension='.da1'):
+    '''Goes once over all the files in a folder of sorted DA1s (STUDY-sorted,
+    with STUDY-s, STUDY-q and STUDY-reject inside) and writes every line to the files of the experiments
+    its condition belongs to (see create_experiment_folders()).
     '''
-    # unpack the item tuple
-    s_number, sents, questions, rejects = item
-    # subset sentences, questions, rejections
-    exp_sents = [s for s in sents if s[1] in cond_range]
-    exp_qs =  [q for q in questions if q[1] in cond_range]
-    exp_rej =  [r for r in rejects if r[1] in cond_range]
-    # put things back together and return
-    return (s_number, exp_sents, exp_qs, exp_rej)
+    study_name = get_study_name(sorted_dir_path)
+    for trial_type, suffix in _TRIAL_TYPE_SUFFIXES.items():
+        type_root = os.path.join(sorted_dir_path, study_name + suffix)
+        for file_path in gen_file_paths(type_root, filter_func=is_DA1_file):
+            subj_number = get_subj_num(file_path)
+            # the files of every sorted file are written separately, so a
+            # later file for the same subject replaces an earlier one, just
+            # like with write_da1()
+            outputs = {}
+            try:
+                for line in iter_byte_lines(file_path):
+                    fields = line.split()
+                    if len(fields) > 1 and fields[1] in experiment_folders:
+                        write_sorted_line(outputs, experiment_folders[fields[1]],
+                            trial_type, subj_number, extension,
+                            join_da1_fields(fields, line))
+            finally:
+                for output in outputs.values():
+                    output.close()
 
 
 ###############################################################################
 ## writing sorted DA1s to folders
 ###############################################################################
 
-def write_da1(study_exp_name, data, nest_under=''):
+def write_da1(study_exp_name, data, nest_under='', extension='.da1',
+              threads=WRITE_THREADS, fsync='none'):
     '''Given a study or experiment name as well as the data for writing,
     creates a folder corresponding to the experiment/study name and writes
     data to subfolders inside it, one for every suffix in the "suffixes" list.
     The suffixes stand for be basic trial types: sentences, questions, rejections.
     The optional nest_under argument can specify that the whole output folder
     should be created inside the folder passed as "nest_under".
+    The files get the given extension, see da1_extension().
+    "threads" and "fsync" are passed on to util.write_tables().
+    Returns the (file_name, error) pairs of the files that could not be
+    written.
     '''
     suffixes = [
     ('-s', 1),
@@ -248,30 +469,42 @@ def write_da1(study_exp_name, data, nest_under=''):
     else:
         root_path = study_exp_name + '-sorted'
     print('Writing sorted DA1s to {0}'.format(root_path))
+    failures = []
     for suff, index in suffixes:
         # use the index variable to select only data relevant for this suffix
         relevant = [(item[0], item[index]) for item in data]
-        create_folder(root_path, study_exp_name, suff, relevant)
+        failures += create_folder(root_path, study_exp_name, suff, relevant,
+            extension, threads=threads, fsync=fsync)
+    return failures
 
 
-def create_folder(root_path, study_exp_name, suffix, data):
+def create_folder(root_path, study_exp_name, suffix, data, extension='.da1',
+                  threads=WRITE_THREADS, fsync='none'):
     '''Given a root path as well as a study or experiment name, a suffix
     (e.g. -s or -q) and data to write, creates an output folder under the root_path
     directory with the passed suffix.
     Then creates files for all the subjects that have non-empty data for
-    this folder.
+    this folder. The files are compressed if the extension says so
+    (e.g. ".da1.gz"). They are written by several threads at the same time,
+    see util.write_tables(). A file that cannot be written is reported and
+    does not stop the others.
+    Returns the (file_name, error) pairs of the files that failed.
     '''
     # we start by setting up the output folder
     output_root = os.path.join(root_path, study_exp_name + suffix)
     os.makedirs(output_root, exist_ok=True)
     # we then make sure we're not writing empty lists to files
     existing_data = (item for item in data if len(item[1]) > 0)
-    # for all subjects that have data associated with them...
-    for subj_n, trials in existing_data:
-        # create the name for the subject's file and turn it into a path
-        subj_file_name = subj_n + '-' + study_exp_name + suffix + '.da1'
-        subj_file_path = os.path.join(output_root, subj_file_name)
-        write_to_table(subj_file_path, trials, delimiter=' ')
+    # for all subjects that have data associated with them, create the name
+    # for the subject's file and turn it into a path
+    subj_tables = ((os.path.join(output_root,
+            subj_n + '-' + study_exp_name + suffix + extension), trials)
+        for subj_n, trials in existing_data)
+    failures = write_tables(subj_tables, threads=threads, fsync=fsync,
+        delimiter=' ')
+    for file_name, error in failures:
+        print('Could not write {0}: {1}'.format(file_name, error))
+    return failures
 
 
 if __name__ == '__main__':
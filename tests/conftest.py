@@ -0,0 +1,6 @@
+'''The scripts of EyePy are not a package, so the tests import them from the
+folder above this one.
+'''
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+'''Tests for eye_measures.py.'''
+
+import random
+import eye_measures
+from eye_measures import (RegionLayout, trial_measures, first_fixation,
+    first_pass, first_skip, single_fixation, prob_regression, regression_path,
+    right_bound, total_time, rereading_time, prob_rereading)
+
+# the single-measure functions, in the order of MEASURE_NAMES
+SINGLE_MEASURES = (first_fixation, first_pass, first_skip, single_fixation,
+    prob_regression, regression_path, right_bound, total_time, rereading_time,
+    prob_rereading)
+
+
+def random_regions(rnd):
+    '''Returns regions in reading order, some of them spanning several lines,
+    and sometimes shuffles them so that they are not in reading order.
+    '''
+    regions = []
+    x, y = 0, rnd.randint(0, 1)
+    for r in range(rnd.randint(1, 7)):
+        if rnd.random() < 0.25:
+            # a region spanning several lines
+            end_y, end_x = y + rnd.randint(1, 3), rnd.randint(0, 6)
+        else:
+            end_y, end_x = y, x + rnd.randint(0, 6)
+        regions.append(((x, y), (end_x, end_y)))
+        x, y = end_x, end_y
+        if rnd.random() < 0.2:
+            x, y = rnd.randint(0, 3), y + 1
+    if rnd.random() < 0.1:
+        rnd.shuffle(regions)
+    return regions, y + 1
+
+
+def random_fixations(rnd, last_line):
+    '''Returns fixations all over the regions, including ignored ones
+    (X == -1) and ones with zero or negative durations.
+    '''
+    return tuple((rnd.choice([-1] + list(range(20))), rnd.randint(0, last_line),
+            rnd.choice([0, 1, 5, 100, -3]))
+        for f in range(rnd.randint(0, 15)))
+
+
+def test_trial_measures_match_single_measures():
+    rnd = random.Random(3)
+    layouts = {True: 0, False: 0}
+    for trial in range(5000):
+        regions, last_line = random_regions(rnd)
+        fixations = random_fixations(rnd, last_line)
+        layout = RegionLayout(regions)
+        layouts[layout.regular] += 1
+        expected = [tuple(measure(region, fixations) for measure in SINGLE_MEASURES)
+            for region in regions]
+        # repr() also tells ints from floats, which the R table shows
+        assert repr(trial_measures(layout, fixations)) == repr(expected)
+        assert repr(trial_measures(regions, fixations)) == repr(expected)
+    # both the indexed and the fused (region_check) code ran
+    assert layouts[True] > 1000 and layouts[False] > 100
+
+
+def test_registry_matches_single_measures():
+    rnd = random.Random(4)
+    for trial in range(1000):
+        regions, last_line = random_regions(rnd)
+        fixations = random_fixations(rnd, last_line)
+        for region in regions:
+            expected = tuple(measure(region, fixations)
+                for measure in SINGLE_MEASURES)
+            assert repr(eye_measures.compute_measures(region, fixations,
+                eye_measures.MEASURE_NAMES)) == repr(expected)
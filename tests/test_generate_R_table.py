@@ -0,0 +1,97 @@
+'''Tests for generate_R_table.py, run on synthetic data from benchmark.py.'''
+
+import os, sys, gzip
+import generate_R_table
+from benchmark import make_study
+
+
+def make_data(folder, subjects=3):
+    '''Writes a small study into folder and returns the answers to the
+    questions generate_R_table.py asks.
+    '''
+    sentence_dir = os.path.join(folder, 'sentences')
+    question_dir = os.path.join(folder, 'questions')
+    os.mkdir(sentence_dir)
+    os.mkdir(question_dir)
+    del_file_name, da1_file_names = make_study(sentence_dir, subjects=subjects,
+        items=4, regions=4, fixations=10)
+    key_file_name = os.path.join(folder, 'key.txt')
+    with open(key_file_name, 'w') as key_file:
+        key_file.write('1 1 0\n')
+    return [del_file_name, key_file_name, sentence_dir, question_dir,
+        'out.txt'], da1_file_names
+
+
+def run_generate(monkeypatch, answers, *options):
+    '''Runs generate_R_table.py with the options, answering its questions.'''
+    monkeypatch.setattr(sys, 'argv', ['generate_R_table.py'] + list(options))
+    answers = iter(answers)
+    monkeypatch.setattr('builtins.input', lambda prompt='': next(answers))
+    generate_R_table.main()
+
+
+def test_incremental_codes_leave_no_partial_files(tmp_path, monkeypatch, capsys):
+    answers, da1_file_names = make_data(str(tmp_path))
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    monkeypatch.chdir(out_dir)
+    options = ('--incremental', '--codes', '--no-cache', '--cutoffs', '40:1000')
+    run_generate(monkeypatch, answers, *options)
+
+    # change one subject, so that only its rows are regenerated and spliced
+    with open(da1_file_names[1]) as da1_file:
+        lines = da1_file.readlines()
+    with open(da1_file_names[1], 'w') as da1_file:
+        da1_file.writelines(lines[:-1])
+    os.remove('out_codes.txt')
+    run_generate(monkeypatch, answers, *options)
+
+    assert 'Only 1 of 3 subjects changed' in capsys.readouterr().out
+    assert sorted(os.listdir('.')) == ['excluded_fixation_counts.csv',
+        'out.txt', 'out.txt.manifest.json', 'out_codes.txt']
+
+
+def test_stream_matches_default_with_repeated_trials(tmp_path, monkeypatch):
+    answers, da1_file_names = make_data(str(tmp_path))
+    # repeat a trial with other fixations further down in the file
+    with open(da1_file_names[0]) as da1_file:
+        lines = da1_file.readlines()
+    repeated = lines[1].split(' ')
+    repeated[0] = '99'
+    repeated[-1] = str(int(repeated[-1]) + 300) + '\n'
+    lines.insert(3, ' '.join(repeated))
+    with open(da1_file_names[0], 'w') as da1_file:
+        da1_file.writelines(lines)
+
+    outputs = {}
+    for mode in ('default', 'stream'):
+        out_dir = tmp_path / mode
+        out_dir.mkdir()
+        monkeypatch.chdir(out_dir)
+        options = ['--no-cache', '--cutoffs', '40:1000']
+        if mode == 'stream':
+            options.append('--stream')
+        run_generate(monkeypatch, answers, *options)
+        outputs[mode] = [(out_dir / name).read_text()
+            for name in ('out.txt', 'excluded_fixation_counts.csv')]
+    assert outputs['stream'] == outputs['default']
+
+
+def test_exclusions_compressed_like_the_table(tmp_path, monkeypatch):
+    answers, da1_file_names = make_data(str(tmp_path))
+    answers[-1] = 'out.txt.gz'
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    monkeypatch.chdir(out_dir)
+    options = ('--incremental', '--no-cache', '--cutoffs', '40:1000')
+    run_generate(monkeypatch, answers, *options)
+    with open(da1_file_names[1]) as da1_file:
+        lines = da1_file.readlines()
+    with open(da1_file_names[1], 'w') as da1_file:
+        da1_file.writelines(lines[:-1])
+    run_generate(monkeypatch, answers, *options)
+
+    assert sorted(os.listdir('.')) == ['excluded_fixation_counts.csv.gz',
+        'out.txt.gz', 'out.txt.gz.manifest.json']
+    with gzip.open('excluded_fixation_counts.csv.gz', 'rt') as exclusions:
+        assert exclusions.readline().strip() == 'Subject,Excluded,Total'
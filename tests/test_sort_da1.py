@@ -0,0 +1,33 @@
+'''Tests for sort_da1.py.'''
+
+import os, filecmp
+from sort_da1 import split_da1_files, sort_da1_data, write_da1
+
+SENTENCE = '1 2 1 5000 2 0 0 1 10 0 100\n'
+QUESTION = '2 2 1 1500 6 0 0 0\n'
+
+
+def folder_files(folder):
+    '''Returns the paths of all files in folder, relative to it.'''
+    return sorted(os.path.relpath(os.path.join(root, name), folder)
+        for root, dirs, names in os.walk(folder) for name in names)
+
+
+def test_duplicate_subjects_split_like_write_da1(tmp_path, monkeypatch):
+    data_dir = tmp_path / 'DA1'
+    data_dir.mkdir()
+    # two files for subject 1, only the first of which has questions
+    (data_dir / '1a.da1').write_text(SENTENCE + QUESTION)
+    (data_dir / '1b.da1').write_text(SENTENCE.replace('5000', '4000'))
+    (data_dir / '2.da1').write_text(SENTENCE + QUESTION)
+
+    monkeypatch.chdir(tmp_path)
+    split_da1_files(str(data_dir), 'streamed')
+    write_da1('written', sort_da1_data(str(data_dir)))
+
+    streamed = folder_files('streamed-sorted')
+    written = folder_files('written-sorted')
+    assert streamed == [name.replace('written', 'streamed') for name in written]
+    for streamed_name, written_name in zip(streamed, written):
+        assert filecmp.cmp(os.path.join('streamed-sorted', streamed_name),
+            os.path.join('written-sorted', written_name), shallow=False)
@@ -0,0 +1,39 @@
+'''Tests for util.py.'''
+
+import pytest
+from util import write_tables
+
+
+def test_write_tables_reports_rows_that_cannot_be_encoded(tmp_path):
+    bad_file = str(tmp_path / 'bad.txt')
+    good_files = [str(tmp_path / '{0}.txt'.format(number))
+        for number in range(5)]
+    # a lone surrogate cannot be encoded in any codec
+    tables = [(bad_file, [('1', '\udc80')])]
+    tables += [(file_name, [('1', '2')]) for file_name in good_files]
+    failures = write_tables(tables, threads=2, batch_size=1)
+    assert [file_name for file_name, error in failures] == [bad_file]
+    assert isinstance(failures[0][1], UnicodeEncodeError)
+    for file_name in good_files:
+        with open(file_name, newline='') as table_file:
+            assert table_file.read() == '1,2\r\n'
+
+
+def test_fixation_numbers_never_drop_fields(monkeypatch):
+    import util
+    text = b'1 2 3 4  5 6\t7 8 9'
+    assert list(util.fixation_numbers(text)) == list(range(1, 9))
+
+    # older versions of NumPy return the numbers before a bad field
+    class TruncatingNumPy(object):
+        int64 = 'int64'
+
+        @staticmethod
+        def fromstring(text, dtype, sep):
+            return [1, 2]
+
+    monkeypatch.setattr(util, 'np', TruncatingNumPy)
+    with pytest.raises(ValueError):
+        util.fixation_numbers(b'1 2 x 4')
+    # a result with too few numbers is parsed again with int()
+    assert list(util.fixation_numbers(text)) == list(range(1, 9))
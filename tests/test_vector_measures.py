@@ -0,0 +1,29 @@
+'''Tests for vector_measures.py, which are skipped without NumPy.'''
+
+import random
+import pytest
+import vector_measures
+from test_eye_measures import SINGLE_MEASURES, random_regions, random_fixations
+
+pytest.importorskip('numpy')
+
+
+def test_numpy_engine_matches_eye_measures():
+    rnd = random.Random(5)
+    vectorized = 0
+    for trial in range(3000):
+        regions, last_line = random_regions(rnd)
+        fixations = random_fixations(rnd, last_line)
+        # mostly positive durations, which the numpy code handles itself;
+        # the others go to the pure Python engine
+        if rnd.random() < 0.8:
+            fixations = tuple((X, Y, abs(duration) or 1)
+                for X, Y, duration in fixations)
+            vectorized += bool(fixations)
+        expected = [tuple(measure(region, fixations) for measure in SINGLE_MEASURES)
+            for region in regions]
+        # repr() also tells ints from floats, which the R table shows
+        assert repr(vector_measures.trial_measures(regions, fixations)) == repr(expected)
+        # the cross-check raises an exception if anything differs
+        vector_measures.checked_trial_measures(regions, fixations)
+    assert vectorized > 1000
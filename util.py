@@ -9,6 +9,9 @@ scripts. It is intended to simplify maintenance and take care of some boilerplat
 # 3. Processing file paths and names
 # 4. Writing to files
 # 5. Reading in table files
+# 6. Compact storage for fixations
+# 7. Reading DA1 files as bytes
+# 8. Caching parsed files
 
 # N.B.
 # This module uses some generator functions. In case you are not familiar with
@@ -21,6 +24,25 @@ import os, re, csv
 import re
 # import table file writing module
 import csv
+# compact arrays of numbers and helpers for filling them
+from array import array
+from itertools import accumulate, chain, islice
+from operator import sub
+# hashing and storing parsed files in the cache
+import hashlib, pickle
+# reading and writing compressed files
+import io, gzip, lzma, bz2
+# reading DA1 files without decoding them line by line
+import mmap
+# writing many small files at the same time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+# NumPy is optional: if it is installed, it converts the fixations of DA1
+# files to numbers much faster than int() does
+try:
+    import numpy as np
+except ImportError:
+    np = None
 # import readline and set tab-completion based on what OS we are in
 import readline
 # MACOS uses "libedit" for readline functionality and has a different command
@@ -74,9 +96,12 @@ def is_yes(user_input):
 
 def is_DA1_file(filename):
     '''Checks if a file name has DA1 extension.
-    Currently accepts both ".da1" and ".DA1" files.
+    Currently accepts both ".da1" and ".DA1" files, as well as compressed
+    ones, e.g. ".da1.gz" (see open_table_file()).
     Retunrs a boolean (True or False).
     '''
+    if compression_codec(filename):
+        filename = os.path.splitext(filename)[0]
     return filename.endswith('.da1') or filename.endswith('.DA1')
 
 
@@ -105,6 +130,18 @@ def get_subj_num(file_path):
     return matches[0]
 
 
+def split_extension(file_name):
+    '''Same as os.path.splitext(), except that the extension of a compressed
+    file includes the extension before the compression one
+    ("out.txt.gz" -> ("out", ".txt.gz")).
+    '''
+    root, extension = os.path.splitext(file_name)
+    if compression_codec(file_name):
+        root, inner_extension = os.path.splitext(root)
+        extension = inner_extension + extension
+    return root, extension
+
+
 def gen_file_paths(dir_name, filter_func=None):
     '''A function for wrapping all the os.path commands involved in listing files
     in a directory, then turning file names into file paths by concatenating
@@ -123,6 +160,46 @@ def gen_file_paths(dir_name, filter_func=None):
 ## Functions for writing to files
 ###############################################################################
 
+# modules for reading and writing compressed files, by file extension
+_CODECS = {
+    '.gz': gzip,
+    '.xz': lzma,
+    '.bz2': bz2,
+}
+# names of the compression formats as the scripts' --compress options take them
+COMPRESSION_FORMATS = tuple(sorted(extension[1:] for extension in _CODECS))
+
+# size of the read and write buffers for table files
+TABLE_BUFFER_SIZE = 1 << 20
+
+
+def compression_codec(file_name):
+    '''Returns the module for (de)compressing a file based on its extension,
+    or None if the file is not compressed.
+    '''
+    return _CODECS.get(os.path.splitext(file_name)[1].lower())
+
+
+def open_table_file(file_name, mode='r', newline=None):
+    '''Opens a text file for reading ("r") or writing ("w") with a large
+    buffer. Files ending with .gz, .xz or .bz2 are decompressed while they are
+    read and compressed while they are written, without ever storing the
+    uncompressed contents on disk.
+    With mode "rb" or "wb" the file is opened as bytes instead of text.
+    '''
+    codec = compression_codec(file_name)
+    if codec is None:
+        return open(file_name, mode, buffering=TABLE_BUFFER_SIZE, newline=newline)
+    compressed = codec.open(file_name, mode.rstrip('b') + 'b')
+    if mode.startswith('r'):
+        buffered = io.BufferedReader(compressed, TABLE_BUFFER_SIZE)
+    else:
+        buffered = io.BufferedWriter(compressed, TABLE_BUFFER_SIZE)
+    if mode.endswith('b'):
+        return buffered
+    return io.TextIOWrapper(buffered, newline=newline)
+
+
 def create_row_dicts(fields, data, fill_val='NA'):
     '''Helper generator function for the write_to_table(). Collecting data
     is often much more efficient and clear when this data is stored in tuples
@@ -145,14 +222,19 @@ def create_row_dicts(fields, data, fill_val='NA'):
         yield dict(zip(fields, row))
 
 
+# number of rows write_to_table() checks and writes at a time
+WRITE_CHUNK_SIZE = 10000
+
+
 def write_to_table(file_name, data, header=None, **kwargs):
-    '''Writes data to file specified by filename.
+    '''Writes data to file specified by filename. The file is compressed if its
+    name ends with .gz, .xz or .bz2.
 
     :type file_name: string
     :param file_name: name of the file to be created
     :type data: iterable
-    :param data: some iterable of dictionaries each of which
-    must not contain keys absent in the 'header' argument
+    :param data: some iterable of rows (tuples or lists), each of which
+    must not have more values than there are columns in the 'header' argument
     :type header: list
     :param header: list of columns to appear in the output
     :type **kwargs: dict
@@ -160,15 +242,113 @@ def write_to_table(file_name, data, header=None, **kwargs):
     For instance, restvals specifies what to set empty cells to by default or
     'dialect' loads a whole host of parameters associated with a certain csv
     dialect (eg. "excel").
+
+    Rows are written in chunks. If all the rows of a chunk have as many values
+    as there are columns, they are written as they are. Otherwise the chunk
+    goes through create_row_dicts() and DictWriter, which fill in the missing
+    values (and complain about rows that are too long).
+    '''
+    with open_table_file(file_name, 'w') as f:
+        if not header:
+            csv.writer(f, **kwargs).writerows(data)
+            return
+        # DictWriter is only needed for ragged rows
+        dict_output = csv.DictWriter(f, header, **kwargs)
+        dict_output.writeheader()
+        writer_kwargs = dict((key, value) for key, value in kwargs.items()
+            if key not in ('restval', 'extrasaction'))
+        output = csv.writer(f, **writer_kwargs)
+        column_count = len(header)
+        data = iter(data)
+        chunk = list(islice(data, WRITE_CHUNK_SIZE))
+        while chunk:
+            # one pass over the lengths of the whole chunk
+            if any(map(column_count.__ne__, map(len, chunk))):
+                dict_output.writerows(create_row_dicts(header, map(tuple, chunk),
+                    fill_val=dict_output.restval))
+            else:
+                output.writerows(chunk)
+            chunk = list(islice(data, WRITE_CHUNK_SIZE))
+
+
+# how write_tables() makes sure the files are on disk before it returns:
+# "none" leaves it to the operating system, "files" waits for the contents of
+# every file (os.fsync()), "folders" also for the folders they are in, so that
+# the new file names survive a crash too
+FSYNC_POLICIES = ('none', 'files', 'folders')
+
+# number of threads write_tables() uses and of files every thread writes
+# in one go
+WRITE_THREADS = 8
+WRITE_BATCH_SIZE = 32
+
+
+def write_tables(tables, threads=WRITE_THREADS, fsync='none',
+                 batch_size=WRITE_BATCH_SIZE, **kwargs):
+    '''Writes many tables at once. "tables" are (file_name, data) pairs, each
+    of which is written with write_to_table(file_name, data, **kwargs).
+    The files are handed out in batches of batch_size to a pool of "threads"
+    threads, so that opening, writing and closing them overlaps, which makes
+    a big difference for thousands of small files on network storage.
+    If the same file name comes up several times, only the last data is
+    written, just as if the files were written one after another.
+    A file that cannot be written does not stop the others: returns a list of
+    (file_name, error) pairs for all the files (and, with fsync="folders",
+    folders) that failed.
     '''
-    with open(file_name, 'w') as f:
-        if header:
-            output = csv.DictWriter(f, header, **kwargs)
-            output.writeheader()
-            data = create_row_dicts(header, data, fill_val=output.restval)
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError('fsync should be one of {0}, not "{1}"'.format(
+            ', '.join(FSYNC_POLICIES), fsync))
+    # the last data for every file name, in the order the names came up
+    tables = iter(dict(tables).items())
+    batches = iter(lambda: list(islice(tables, batch_size)), [])
+    write_batch = partial(_write_table_batch, sync=fsync != 'none',
+        kwargs=kwargs)
+    failures = []
+    folders = set()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for batch_folders, batch_failures in executor.map(write_batch, batches):
+            folders.update(batch_folders)
+            failures += batch_failures
+    if fsync == 'folders':
+        for folder in sorted(folders):
+            try:
+                fsync_path(folder)
+            except OSError as error:
+                failures.append((folder, error))
+    return failures
+
+
+def _write_table_batch(batch, sync, kwargs):
+    '''Runs in a thread of write_tables(). Writes the tables of one batch and
+    returns the folders of the files written and the (file_name, error) pairs
+    of the files that failed.
+    '''
+    folders = set()
+    failures = []
+    for file_name, data in batch:
+        try:
+            write_to_table(file_name, data, **kwargs)
+            if sync:
+                fsync_path(file_name)
+        # whatever goes wrong with one file (e.g. a row that cannot be
+        # encoded) is reported for that file without stopping the others
+        except Exception as error:
+            failures.append((file_name, error))
         else:
-            output = csv.writer(f, **kwargs)
-        output.writerows(data)
+            folders.add(os.path.dirname(file_name) or os.curdir)
+    return (folders, failures)
+
+
+def fsync_path(path):
+    '''Waits until the contents of a file (or the list of files in a folder)
+    are written to disk.
+    '''
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
 
 
 ###############################################################################
@@ -179,10 +359,21 @@ def read_table(filename):
     '''Takes a file name as a string, opens it. Once that's done, takes each
     non-empty row of the file and converts it into a tuple of strings.
     Returns a list of rows (as tuples of strings).
+    Compressed files are supported, see open_table_file().
     '''
-    with open(filename) as input_file:
+    return tuple(iter_table(filename))
+
+
+def iter_table(filename):
+    '''Generator version of read_table(): yields the non-empty rows of the file
+    (as tuples of strings) one at a time, so that only one row is kept
+    in memory.
+    '''
+    with open_table_file(filename) as input_file:
         nonewlines = (line.strip() for line in input_file)
-        return tuple(tuple(line.split()) for line in nonewlines if line)
+        for line in nonewlines:
+            if line:
+                yield tuple(line.split())
 
 
 def tag_table(table_lines, one, two):
@@ -281,18 +472,387 @@ def fixation_data(tagged_table):
 
 def read_fixation_table(da1File):
     '''As input takes a DA1 sentence file and returns a dictionary of
-    (condition, item) : ((X1, Y1, duration1), (X2, Y2, duration2), ...)
+    (condition, item) : ((order, cond, item), ((X1, Y1, duration1), (X2, Y2, duration2), ...))
+    The file is read as bytes, see read_da1_fixations().
     '''
-    tagged = tag_table(read_table(da1File), 1, 2)
+    trial_fields, arrays = read_da1_fixations(da1File)
+    # convert every column to Python numbers once, rather than trial by trial
+    X = arrays.X.tolist()
+    Y = arrays.Y.tolist()
+    durations = list(map(sub, arrays.ends, arrays.starts))
+    offsets = arrays.offsets
+    trials = (tuple(zip(X[begin:end], Y[begin:end], durations[begin:end]))
+        for begin, end in zip(offsets, offsets[1:]))
+    return dict(((fields[1], fields[2]), (fields, fixations))
+        for fields, fixations in zip(trial_fields, trials))
+
+
+def fixation_table(table_lines):
+    '''Does the work of read_fixation_table() for the lines of a DA1 sentence
+    file that have already been read and split into fields.
+    '''
+    table_lines = tuple(map(tuple, table_lines))
+    tagged = tag_table(table_lines, 1, 2)
     fixations = fixation_data(tagged)
     return dict_from_table(fixations)
 
 
+def iter_fixation_trials(da1File):
+    '''Streaming version of read_fixation_table(). Reads a DA1 sentence file one
+    line at a time and for every trial yields a tuple of the form:
+    ((condition, item), (order, condition, item), fixations)
+    where fixations are the same (X, Y, duration) tuples as those in the
+    table returned by read_fixation_table().
+    '''
+    for line in iter_byte_lines(da1File):
+        split_line = split_da1_line(line)
+        # skip empty lines
+        if split_line is None:
+            continue
+        trial_fields, numbers = split_line
+        fixations = zip(numbers[0::4], numbers[1::4],
+            map(sub, numbers[3::4], numbers[2::4]))
+        yield ((trial_fields[1], trial_fields[2]), trial_fields, tuple(fixations))
+
+
+def da1_trial_keys(da1File):
+    '''Goes quickly over a DA1 sentence file without parsing the fixations
+    and returns a dictionary of (condition, item) : index pairs, where index
+    counts the trials that iter_fixation_trials() yields and points at the
+    last trial with that condition and item. The pairs are in the order in
+    which every (condition, item) first appears, so the dictionary has the
+    same order and picks the same trials as read_fixation_table().
+    '''
+    trial_keys = {}
+    index = 0
+    for line in iter_byte_lines(da1File):
+        fields = line.split(None, 3)
+        # skip empty lines, like split_da1_line() does
+        if not fields:
+            continue
+        trial_keys[fields[1].decode(), fields[2].decode()] = index
+        index += 1
+    return trial_keys
+
+
 def read_question_table(da1QFile):
     ''' Returns dict of ((cond, item) : (RT, buttonpress)) entries.
     As input assumes a DA1 question file where every line is a list of fields:
     order, cond, item, rt, buttonpress
     '''
-    tagged = tag_table(read_table(da1QFile), 1, 2)
+    return question_table(read_table(da1QFile))
+
+
+def question_table(table_lines):
+    '''Does the work of read_question_table() for the lines of a DA1 question
+    file that have already been read and split into fields.
+    '''
+    table_lines = tuple(map(tuple, table_lines))
+    tagged = tag_table(table_lines, 1, 2)
     RT_button_press = ((tag, line[3:5]) for tag, line in tagged)
     return dict_from_table(RT_button_press)
+
+
+###############################################################################
+## Compact storage for fixations
+###############################################################################
+
+class FixationArrays(object):
+    '''Stores the fixations of many trials (usually all trials of a subject)
+    in four flat arrays of numbers: X and Y coordinates, fixation starts and
+    fixation ends. The fixations of trial number i are found between
+    offsets[i] and offsets[i + 1] in all four arrays.
+    This takes a fraction of the memory needed for a tuple of
+    (X, Y, duration) tuples per trial.
+    '''
+    __slots__ = ('X', 'Y', 'starts', 'ends', 'offsets')
+
+    def __init__(self, X, Y, starts, ends, offsets):
+        self.X = X
+        self.Y = Y
+        self.starts = starts
+        self.ends = ends
+        self.offsets = offsets
+
+    def trials(self):
+        '''Returns a list of TrialFixations, one for every trial.'''
+        return [TrialFixations(self, trial)
+            for trial in range(len(self.offsets) - 1)]
+
+
+class TrialFixations(object):
+    '''The fixations of one trial stored in a FixationArrays object.
+    Looping over it yields the same (X, Y, duration) tuples as the ones
+    stored by read_fixation_table(), so it can be used anywhere such a
+    sequence of fixations is expected. The tuples are created on the fly
+    and never stored.
+    '''
+    __slots__ = ('arrays', 'begin', 'end')
+
+    def __init__(self, arrays, trial):
+        self.arrays = arrays
+        self.begin = arrays.offsets[trial]
+        self.end = arrays.offsets[trial + 1]
+
+    def __len__(self):
+        return self.end - self.begin
+
+    def __iter__(self):
+        X, Y, durations = self.columns()
+        return zip(X, Y, durations)
+
+    def columns(self):
+        '''Returns three arrays: X and Y coordinates and durations of
+        the fixations.
+        '''
+        trial = slice(self.begin, self.end)
+        arrays = self.arrays
+        durations = array('q', map(sub, arrays.ends[trial], arrays.starts[trial]))
+        return (arrays.X[trial], arrays.Y[trial], durations)
+
+    def filtered(self, low_cutoff, high_cutoff):
+        '''Returns a new TrialFixations with only those fixations whose
+        duration is strictly between the two cutoffs.
+        '''
+        arrays = self.arrays
+        kept = [index for index in range(self.begin, self.end)
+            if low_cutoff < arrays.ends[index] - arrays.starts[index] < high_cutoff]
+        new_arrays = FixationArrays(
+            array('i', map(arrays.X.__getitem__, kept)),
+            array('i', map(arrays.Y.__getitem__, kept)),
+            array('q', map(arrays.starts.__getitem__, kept)),
+            array('q', map(arrays.ends.__getitem__, kept)),
+            array('q', (0, len(kept))))
+        return TrialFixations(new_arrays, 0)
+
+
+def fixation_arrays(table_lines):
+    '''Compact version of fixation_data(). Given the lines of a DA1 sentence
+    file, converts the fixations of all of them to numbers in one go and
+    stores them in a FixationArrays object.
+    Returns a list of (trial_fields, TrialFixations) pairs, one per line.
+    '''
+    # number of complete [X Y start end] groups on every line
+    counts = [max(0, (len(line) - 8) // 4) for line in table_lines]
+    # all the fixation fields of the file, converted in bulk
+    numbers = array('q', map(int, chain.from_iterable(
+        line[8:8 + 4 * count] for line, count in zip(table_lines, counts))))
+    arrays = fixation_arrays_from_numbers(numbers, counts)
+    return [(line[:3], trial)
+        for line, trial in zip(table_lines, arrays.trials())]
+
+
+def fixation_arrays_from_numbers(numbers, counts):
+    '''Given an array with the [X Y start end] groups of all fixations of
+    a file one after the other and the number of fixations of every trial,
+    returns a FixationArrays object.
+    '''
+    return FixationArrays(
+        array('i', numbers[0::4]),
+        array('i', numbers[1::4]),
+        numbers[2::4],
+        numbers[3::4],
+        array('q', accumulate(counts, initial=0)))
+
+
+def read_fixation_arrays(da1File):
+    '''Compact version of read_fixation_table(). Returns the same kind of
+    dictionary, except that the fixations of every trial are a TrialFixations
+    object rather than a tuple of tuples.
+    '''
+    trial_fields, arrays = read_da1_fixations(da1File)
+    return dict(((fields[1], fields[2]), (fields, trial))
+        for fields, trial in zip(trial_fields, arrays.trials()))
+
+
+def compact_fixation_table(table_lines):
+    '''Does the work of read_fixation_arrays() for the lines of a DA1 sentence
+    file that have already been read and split into fields.
+    '''
+    table_lines = tuple(map(tuple, table_lines))
+    tags = ((line[1], line[2]) for line in table_lines)
+    return dict(zip(tags, fixation_arrays(table_lines)))
+
+
+###############################################################################
+## Reading DA1 files as bytes
+###############################################################################
+
+# DA1 files are by far the largest input of EyePy. Rather than reading them
+# as text and splitting every line into strings, they are memory-mapped and
+# split as bytes. Only the order, condition and item of every trial are
+# decoded; the fixation fields go straight from bytes into arrays of numbers
+# (converted by NumPy in C if it is installed).
+
+def iter_byte_lines(file_name):
+    '''Yields the lines of a file as bytes, line endings included.
+    Uncompressed files are memory-mapped; compressed files (see
+    open_table_file()) are decompressed through a large buffer.
+    '''
+    if compression_codec(file_name) is not None:
+        with open_table_file(file_name, 'rb') as input_file:
+            yield from input_file
+        return
+    with open(file_name, 'rb') as input_file:
+        # empty files cannot be memory-mapped
+        if os.fstat(input_file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from iter(mapped.readline, b'')
+
+
+def split_da1_line(line):
+    '''Splits a line of a DA1 sentence file (as bytes) into a tuple of
+    (order, cond, item) strings and an array with the numbers of its
+    complete [X Y start end] fixation groups, see fixation_numbers().
+    Returns None for empty lines.
+    '''
+    # the first 8 fields and everything after them in one piece
+    fields = line.split(None, 8)
+    if not fields:
+        return None
+    trial_fields = tuple(field.decode() for field in fields[:3])
+    if len(fields) < 9:
+        return (trial_fields, array('q'))
+    return (trial_fields, fixation_numbers(fields[8]))
+
+
+def fixation_numbers(text):
+    '''Given the fixation fields of a DA1 line as bytes, returns an array('q')
+    with the numbers of all complete [X Y start end] groups. Fields of an
+    incomplete group at the end of the line are ignored.
+    '''
+    fields = text.split()
+    if np is not None:
+        try:
+            parsed = np.fromstring(text, dtype=np.int64, sep=' ')
+        except ValueError:
+            # a field is not a number, let int() below complain about it
+            parsed = None
+        # older versions of NumPy only warn about a field that is not a
+        # number and return the numbers before it, so the count is checked
+        if parsed is not None and len(parsed) == len(fields):
+            numbers = array('q')
+            numbers.frombytes(parsed[:len(parsed) - len(parsed) % 4].tobytes())
+            return numbers
+    return array('q', map(int, fields[:len(fields) - len(fields) % 4]))
+
+
+def read_da1_fixations(da1File):
+    '''Reads a DA1 sentence file as bytes and returns a list with the
+    (order, cond, item) fields of every trial and a FixationArrays object
+    with their fixations, in the same order.
+    '''
+    trial_fields = []
+    counts = []
+    numbers = array('q')
+    for line in iter_byte_lines(da1File):
+        split_line = split_da1_line(line)
+        # skip empty lines
+        if split_line is None:
+            continue
+        trial_fields.append(split_line[0])
+        counts.append(len(split_line[1]) // 4)
+        numbers.extend(split_line[1])
+    return (trial_fields, fixation_arrays_from_numbers(numbers, counts))
+
+
+###############################################################################
+## Caching parsed files
+###############################################################################
+
+# Parsed DA1 tables can be stored on disk, so that running the scripts again
+# on the same files does not have to parse them again. Every cached table is
+# stored in its own file together with the size, modification time and a
+# hash of the contents of the file it was parsed from. The cached table is
+# only used if all three still match.
+
+# change this whenever the structure of the parsed tables changes,
+# so that old cache files are not used anymore
+_CACHE_VERSION = 1
+
+# by default the cache is not allowed to grow past this many megabytes
+DEFAULT_CACHE_SIZE = 2048
+
+
+def default_cache_dir():
+    '''Returns the folder where parsed files are cached by default:
+    "eyepy" inside the user's cache folder.
+    '''
+    user_cache = os.environ.get('XDG_CACHE_HOME')
+    if not user_cache:
+        user_cache = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(user_cache, 'eyepy')
+
+
+def file_digest(file_path):
+    '''Returns the SHA-1 hash of a file's contents as a string of hex digits.'''
+    sha = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def read_cached(reader, file_path, cache_dir=None):
+    '''Returns the same as reader(file_path), where reader is one of the
+    read_*_table() functions.
+    If cache_dir is given, the result is first looked up in that folder and,
+    if it is not there (or the file has changed since), stored there after
+    calling the reader.
+    '''
+    if not cache_dir:
+        return reader(file_path)
+    stat = os.stat(file_path)
+    file_info = (stat.st_size, stat.st_mtime_ns, file_digest(file_path))
+    # one cache file per input file and reader
+    key = '\0'.join((os.path.abspath(file_path), reader.__module__,
+        reader.__name__, str(_CACHE_VERSION)))
+    cache_file = os.path.join(cache_dir,
+        hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pickle')
+
+    try:
+        with open(cache_file, 'rb') as cached:
+            if pickle.load(cached) == file_info:
+                table = pickle.load(cached)
+                # mark the cache file as recently used, see evict_cache()
+                os.utime(cache_file)
+                return table
+    except Exception:
+        # a missing or broken cache file is the same as no cache file
+        pass
+
+    table = reader(file_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first so that other processes never
+        # see half-written cache files
+        temp_file = '{0}.{1}.tmp'.format(cache_file, os.getpid())
+        with open(temp_file, 'wb') as cached:
+            pickle.dump(file_info, cached, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(table, cached, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, cache_file)
+    except OSError as error:
+        print('Could not save {0} to the cache: {1}'.format(file_path, error))
+    return table
+
+
+def evict_cache(cache_dir, max_megabytes=DEFAULT_CACHE_SIZE):
+    '''Deletes the least recently used files from the cache folder until
+    the cache takes up no more than max_megabytes.
+    '''
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return
+    cache_files = []
+    for cache_file in gen_file_paths(cache_dir,
+            filter_func=lambda name: name.endswith('.pickle')):
+        stat = os.stat(cache_file)
+        cache_files.append((stat.st_mtime, stat.st_size, cache_file))
+    total_size = sum(size for mtime, size, cache_file in cache_files)
+    max_size = max_megabytes * 1024 * 1024
+    # oldest files first
+    for mtime, size, cache_file in sorted(cache_files):
+        if total_size <= max_size:
+            break
+        os.remove(cache_file)
+        total_size -= size
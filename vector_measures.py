@@ -0,0 +1,187 @@
+'''Vectorized versions of the eye-tracking measures from eye_measures.
+Instead of looping over fixations in Python, every trial is turned into a
+(fixations x regions) matrix of positions using NumPy broadcasting, and the
+measures are computed from that matrix with sums and first-index lookups.
+NumPy is an optional dependency: it is only needed if this engine is selected
+when running generate_R_table.py.
+'''
+
+# Structure:
+# 1. Imports
+# 2. Classifying fixations relative to all regions at once
+# 3. Computing the measures
+# 4. Cross-checking against eye_measures
+
+###############################################################################
+## Imports
+###############################################################################
+
+# NumPy is not required by the rest of EyePy, so we only fail once somebody
+# actually tries to use this engine
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import eye_measures
+from util import TrialFixations
+
+
+_NO_NUMPY = ('The numpy engine requires NumPy, which does not seem to be '
+    'installed.\nInstall it or use the default (python) engine.')
+
+def require_numpy():
+    '''Raises an exception explaining what to do if NumPy is not available.'''
+    if np is None:
+        raise Exception(_NO_NUMPY)
+
+
+###############################################################################
+## Classifying fixations
+###############################################################################
+
+def position_matrices(regions, X, Y):
+    '''Given a sequence of regions and arrays with the X and Y coordinates of
+    the fixations of a trial returns three boolean matrices of shape
+    (fixations, regions): "before", "within" and "after".
+    These follow eye_measures.region_check() exactly, including its quirks:
+    fixations with X == -1 are neither of the three, and so are fixations on
+    lines other than the first and last line of a multi-line region.
+    '''
+    # region delimiters as rows that broadcast against the fixation columns
+    coordinates = np.array(regions, dtype=np.int64).reshape(len(regions), 4)
+    xStart, yStart, xEnd, yEnd = coordinates.T
+    X = X[:, None]
+    Y = Y[:, None]
+    not_ignored = X != -1
+    one_line = yStart == yEnd
+
+    on_first_line = Y == yStart
+    # regions that start and end on the same line
+    within_line = on_first_line & (X >= xStart) & (X < xEnd)
+    before_line = (Y < yStart) | (on_first_line & (X < xStart))
+    after_line = (Y > yStart) | (on_first_line & (X >= xStart) & (X >= xEnd))
+    # regions that span several lines
+    on_last_line = ~on_first_line & (Y == yEnd)
+    within_lines = (on_first_line & (X >= xStart)) | (on_last_line & (X < xEnd))
+    before_lines = on_first_line & (X < xStart)
+    after_lines = on_last_line & (X >= xEnd)
+
+    before = np.where(one_line, before_line, before_lines) & not_ignored
+    within = np.where(one_line, within_line, within_lines) & not_ignored
+    after = np.where(one_line, after_line, after_lines) & not_ignored
+    return before, within, after
+
+
+def first_index(mask):
+    '''For every column of a boolean matrix returns the index of the first
+    True row, or the number of rows if the column has no True values.
+    '''
+    return np.where(mask.any(axis=0), mask.argmax(axis=0), mask.shape[0])
+
+
+###############################################################################
+## Computing the measures
+###############################################################################
+
+def trial_measures(regions, fixations):
+    '''Drop-in replacement for eye_measures.trial_measures() that computes the
+    measures with NumPy array operations.
+    Returns a list with one tuple of measure values (in the order of
+    eye_measures.MEASURE_NAMES) per region.
+    '''
+    require_numpy()
+    if not regions or not fixations:
+        return eye_measures.trial_measures(regions, fixations)
+    if isinstance(fixations, TrialFixations):
+        # compact fixations are already stored in arrays
+        X, Y, durations = (np.asarray(column, dtype=np.int64)
+            for column in fixations.columns())
+    else:
+        X, Y, durations = np.array(fixations, dtype=np.int64).T
+    # The vectorized formulas below assume that a region has been entered as
+    # soon as it has a positive sum of durations. That only holds for positive
+    # durations, so anything else is left to the pure Python engine.
+    if (durations <= 0).any():
+        return eye_measures.trial_measures(regions, fixations)
+    return measures_from_arrays(regions, X, Y, durations)
+
+
+def measures_from_arrays(regions, X, Y, durations):
+    '''Does the actual work for trial_measures() given arrays of X and Y
+    coordinates and (positive) durations for all the fixations of a trial.
+    '''
+    before, within, after = position_matrices(regions, X, Y)
+    fixation_count = len(durations)
+    rows = np.arange(fixation_count)[:, None]
+    within_durations = np.where(within, durations[:, None], 0)
+
+    # the region is exited to the right at the first "after" fixation
+    first_after = first_index(after)
+    first_within = first_index(within)
+    # if it was not entered before that, it was skipped
+    entered = first_within < first_after
+    # the first "before" after entering the region is a regression
+    first_regression = first_index(before & (rows > first_within))
+
+    first_fix = np.where(entered,
+        durations[np.minimum(first_within, fixation_count - 1)], 0)
+    pass_end = np.minimum(first_after, first_regression)
+    first_pass = (within_durations * (rows < pass_end)).sum(axis=0)
+    right_bound = (within_durations * (rows < first_after)).sum(axis=0)
+    # regression path: every fixation from entering the region until leaving
+    # it to the right, computed from cumulative durations
+    cumulative = np.concatenate(([0], np.cumsum(durations)))
+    regression = np.where(entered,
+        cumulative[first_after] - cumulative[np.minimum(first_within, first_after)],
+        0)
+    total = within_durations.sum(axis=0)
+    regressed = first_regression < first_after
+
+    all_measures = []
+    for r in range(len(regions)):
+        ff, fp, tt = int(first_fix[r]), int(first_pass[r]), int(total[r])
+        reread = tt - fp
+        prob_regr = int(regressed[r]) if entered[r] else 'NA'
+        all_measures.append((ff, fp, int(not entered[r]),
+            tt if ff == tt else 0, prob_regr, float(regression[r]),
+            float(right_bound[r]), tt, reread, int(reread > 0)))
+    return all_measures
+
+
+###############################################################################
+## Cross-checking against eye_measures
+###############################################################################
+
+# single-measure functions from eye_measures in the order of MEASURE_NAMES
+_REFERENCE_FUNCTIONS = (
+    eye_measures.first_fixation,
+    eye_measures.first_pass,
+    eye_measures.first_skip,
+    eye_measures.single_fixation,
+    eye_measures.prob_regression,
+    eye_measures.regression_path,
+    eye_measures.right_bound,
+    eye_measures.total_time,
+    eye_measures.rereading_time,
+    eye_measures.prob_rereading,
+)
+
+_MISMATCH = ('The numpy engine disagrees with eye_measures on measure "{0}"\n'
+    'region: {1}\nfixations: {2}\nnumpy value: {3}, eye_measures value: {4}')
+
+def checked_trial_measures(regions, fixations):
+    '''Same as trial_measures() but also computes every measure with the
+    single-measure functions from eye_measures and raises an exception
+    as soon as any of the values (or their types) differ.
+    This is slow and only meant for verifying the engine on real data.
+    '''
+    all_measures = trial_measures(regions, fixations)
+    for region, measures in zip(regions, all_measures):
+        for name, value, reference in zip(eye_measures.MEASURE_NAMES,
+                measures, _REFERENCE_FUNCTIONS):
+            expected = reference(region, fixations)
+            if value != expected or type(value) is not type(expected):
+                raise Exception(_MISMATCH.format(name, region, tuple(fixations),
+                    repr(value), repr(expected)))
+    return all_measures